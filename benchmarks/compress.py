@@ -0,0 +1,105 @@
+'''Streaming compressor cost on page and asset sized content.
+
+Pages are written in a few pieces like the site handlers do, assets in
+64 KiB pieces. The output of every compressor is checked to decompress to
+the input. ``GzipFile`` is the compressor used before, for comparison. Run
+from the source tree with ``python -m benchmarks.compress``.
+'''
+import gzip
+import io
+import os
+import timeit
+import zlib
+
+from huhhttp.compress import GzipCompressor, DeflateCompressor, \
+    RawDeflateCompressor, FLUSH_MODES
+from huhhttp.post import POSTS
+from huhhttp.render import SITE_PAGE
+from huhhttp.template import INDEX_CONTENT, WEB_RING_CONTENT
+
+
+ASSET_DIR = os.path.join(os.path.dirname(__file__), '..', 'huhhttp', 'asset')
+ASSETS = ('stylesheet.css', 'banner.bmp', 'songofsmaug.ogg')
+
+
+class GzipFileCompressor(object):
+    def __init__(self, level=6, flush_mode=zlib.Z_NO_FLUSH):
+        self._buffer = io.BytesIO()
+        self._gzip_file = gzip.GzipFile(
+            mode='wb', compresslevel=level, fileobj=self._buffer)
+
+    def write(self, data):
+        self._gzip_file.write(data)
+        new_data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return new_data
+
+    def close(self):
+        self._gzip_file.close()
+        new_data = self._buffer.getvalue()
+        self._buffer.close()
+        return new_data
+
+
+DECOMPRESSORS = {
+    GzipFileCompressor: gzip.decompress,
+    GzipCompressor: gzip.decompress,
+    DeflateCompressor: zlib.decompress,
+    RawDeflateCompressor: lambda data: zlib.decompress(data, -zlib.MAX_WBITS),
+}
+
+
+def workloads():
+    page = SITE_PAGE.render(
+        'utf-8', doctype='<!DOCTYPE HTML>', charset='', title='Web ring',
+        body=INDEX_CONTENT + WEB_RING_CONTENT,
+        recent_posts=''.join(sorted(POSTS.values())[:3]))
+    yield 'page', [page[:len(page) // 3], page[len(page) // 3:]]
+
+    for name in ASSETS:
+        with open(os.path.join(ASSET_DIR, name), 'rb') as file:
+            data = file.read()
+
+        yield name, [data[index:index + 65536]
+                     for index in range(0, len(data), 65536)]
+
+
+def compress(compressor_class, pieces, level, flush_mode):
+    compressor = compressor_class(level=level, flush_mode=flush_mode)
+    parts = [compressor.write(data) for data in pieces]
+    parts.append(compressor.close())
+    return b''.join(parts)
+
+
+def main():
+    for name, pieces in workloads():
+        size = sum(len(data) for data in pieces)
+        print('{} ({} bytes in {} pieces)'.format(name, size, len(pieces)))
+
+        for compressor_class in DECOMPRESSORS:
+            for flush_name, flush_mode in sorted(FLUSH_MODES.items()):
+                if compressor_class is GzipFileCompressor and \
+                        flush_mode != zlib.Z_NO_FLUSH:
+                    continue
+
+                for level in (1, 6, 9):
+                    data = compress(
+                        compressor_class, pieces, level, flush_mode)
+                    assert DECOMPRESSORS[compressor_class](data) == \
+                        b''.join(pieces), compressor_class
+
+                    number = max(1, 2000000 // size)
+                    best = min(timeit.repeat(
+                        lambda: compress(compressor_class, pieces, level,
+                                         flush_mode),
+                        number=number, repeat=3))
+                    print('  {:<20} {:<4} {} {:9.1f} us {:8.1f} MB/s {:7.1%}'
+                          .format(compressor_class.__name__, flush_name,
+                                  level, best / number * 1e6,
+                                  size * number / best / 1e6,
+                                  len(data) / size))
+
+
+if __name__ == '__main__':
+    main()
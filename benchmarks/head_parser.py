@@ -0,0 +1,81 @@
+'''Request head parse cost: readline path versus buffered scan.
+
+Run from the source tree with ``python -m benchmarks.head_parser``.
+'''
+import asyncio
+import timeit
+
+from huhhttp.header import Request, RequestHeadParser
+
+
+REQUEST = (
+    b'GET /wirdpress/post/1997/2/9/hello-world HTTP/1.1\r\n'
+    b'Host: localhost:8080\r\n'
+    b'User-Agent: Mozilla/5.0 (compatible) Wpull/1.0\r\n'
+    b'Accept: text/html,application/xhtml+xml;q=0.9,*/*;q=0.8\r\n'
+    b'Accept-Encoding: gzip, deflate\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Referer: http://localhost:8080/wirdpress/post/all/posts\r\n'
+    b'Cookie: HUHHTTP1=SUPER SERVER!\r\n'
+    b'If-None-Match: 2aae6c35c94fcfb415dbe95f408b9ce91ee846ed\r\n'
+    b'Connection: keep-alive\r\n'
+    b'\r\n'
+)
+
+
+def run_buffered(coroutine):
+    '''Drive a coroutine that only awaits data already buffered.'''
+    try:
+        coroutine.send(None)
+    except StopIteration as error:
+        return error.value
+    else:
+        raise RuntimeError('Coroutine blocked')
+
+
+def readline_path():
+    reader = asyncio.StreamReader()
+    reader.feed_data(REQUEST)
+    lines = []
+
+    while True:
+        line = run_buffered(reader.readline())
+
+        if not line.strip():
+            break
+
+        lines.append(line)
+
+    request = Request()
+    request.parse_lines(lines)
+    return request
+
+
+def scan_path():
+    reader = asyncio.StreamReader()
+    reader.feed_data(REQUEST)
+    buffer = bytearray(run_buffered(reader.read(4096)))
+
+    parser = RequestHeadParser()
+    parser.scan(buffer)
+    request = parser.parse(buffer)
+    del buffer[:parser.end]
+    return request
+
+
+def main():
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    for func in (readline_path, scan_path):
+        request = func()
+        assert request.uri == b'/wirdpress/post/1997/2/9/hello-world'
+        assert len(request.fields) == 9
+
+        number = 20000
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print('{:<15} {:8.2f} us/request'.format(
+            func.__name__, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''Keep-alive request throughput against a running server.
+
+Start the server with a long fuzz period so that the fuzzer stays near
+zero, for example ``python -m huhhttp --core protocol --fuzz-period
+1000000000``, then run ``python -m benchmarks.keepalive_load``.
+Responses the fuzzer breaks are counted as errors and the client
+reconnects.
+
+Assets are served from memory unless they are larger than
+``--asset-file-size``. To measure the sendfile path instead, start the
+server with ``--asset-file-size 0`` and request a large asset, for
+example ``--path /images/banner_hd.bmp``. Uncompressed responses over
+10000 bytes are sent with sendfile unless the server has
+``--fragmented-writes``.
+'''
+import argparse
+import socket
+import threading
+import time
+
+
+def read_response(sock_file):
+    status_line = sock_file.readline()
+
+    if not status_line.startswith(b'HTTP/1.1 '):
+        raise ValueError('Bad status line')
+
+    length = None
+    chunked = False
+
+    while True:
+        line = sock_file.readline()
+
+        if not line:
+            raise ValueError('Connection closed')
+        elif not line.strip():
+            break
+
+        name, value = line.split(b':', 1)
+        name = name.strip().lower()
+
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = b'chunked' in value.lower()
+
+    if chunked:
+        while True:
+            size = int(sock_file.readline().split(b';')[0], 16)
+            sock_file.read(size + 2)
+
+            if not size:
+                break
+    elif length is not None:
+        sock_file.read(length)
+    else:
+        raise ValueError('No length')
+
+
+def client(args, deadline, results, pipeline):
+    request = ('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'
+               .format(args.path, args.host).encode('ascii'))
+    ok = errors = 0
+
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((args.host, args.port)) as sock, \
+                    sock.makefile('rb') as sock_file:
+                sock.settimeout(5)
+
+                while time.time() < deadline:
+                    sock.sendall(request * pipeline)
+
+                    for dummy in range(pipeline):
+                        read_response(sock_file)
+                        ok += 1
+        except (OSError, ValueError):
+            errors += 1
+
+    results.append((ok, errors))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--host', default='localhost')
+    arg_parser.add_argument('--port', default=8080, type=int)
+    arg_parser.add_argument('--path', default='/smoketest')
+    arg_parser.add_argument('--connections', default=8, type=int)
+    arg_parser.add_argument('--duration', default=10, type=float)
+    arg_parser.add_argument('--pipeline', default=1, type=int)
+    args = arg_parser.parse_args()
+
+    deadline = time.time() + args.duration
+    results = []
+    threads = [
+        threading.Thread(target=client,
+                         args=(args, deadline, results, args.pipeline))
+        for dummy in range(args.connections)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    ok = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    print('{} responses, {} errors, {:.1f} responses/s'.format(
+        ok, errors, ok / args.duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''Page rendering cost: format and encode versus pre-encoded templates.
+
+Every codec the fuzzer can pick is checked to give the same bytes both
+ways. Run from the source tree with ``python -m benchmarks.render``.
+'''
+import codecs
+import timeit
+
+from huhhttp.fuzz import CODEC_NAMES, CHARSET_DECLARATIONS, DOCTYPES
+from huhhttp.post import POSTS
+from huhhttp.render import SITE_PAGE, is_stateful
+from huhhttp.template import INDEX_CONTENT
+
+
+def page_values():
+    posts = sorted(POSTS.items())
+    values = []
+
+    for index, (date, post) in enumerate(posts[:20]):
+        values.append({
+            'doctype': DOCTYPES[index % len(DOCTYPES)],
+            'charset': CHARSET_DECLARATIONS[index % len(
+                CHARSET_DECLARATIONS)].format(name='UTF-8'),
+            'title': post[:60] + ' \ud800 Я могу есть стекло',
+            'body': post if index % 2 else INDEX_CONTENT,
+            'recent_posts': '<LI>{}</LI>'.format(post[:60]),
+        })
+
+    return values
+
+
+def main():
+    values = page_values()
+
+    for codec_name in CODEC_NAMES:
+        for page in values:
+            expected = SITE_PAGE.format(**page).encode(codec_name, 'replace')
+            assert SITE_PAGE.render(codec_name, **page) == expected, \
+                codec_name
+
+    print('{} codecs, {} pages'.format(len(CODEC_NAMES), len(values)))
+
+    groups = (
+        ('stateless', [
+            name for name in CODEC_NAMES
+            if not is_stateful(codecs.lookup(name).name)]),
+        ('stateful', [
+            name for name in CODEC_NAMES
+            if is_stateful(codecs.lookup(name).name)]),
+    )
+
+    for group_name, codec_names in groups:
+        def run_format():
+            for codec_name in codec_names:
+                for page in values:
+                    SITE_PAGE.format(**page).encode(codec_name, 'replace')
+
+        def run_render():
+            for codec_name in codec_names:
+                for page in values:
+                    SITE_PAGE.render(codec_name, **page)
+
+        for name, func in (('format', run_format), ('render', run_render)):
+            number = 5
+            best = min(timeit.repeat(func, number=number, repeat=3))
+            print('{:<9} {:<6} {:8.2f} us/page'.format(
+                group_name, name,
+                best / number / len(codec_names) / len(values) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''Route lookup cost: linear re.fullmatch scan versus the compiled Router.
+
+The URL mix is taken from the links in the site's own templates and posts.
+Run from the source tree with ``python -m benchmarks.router``.
+'''
+import re
+import timeit
+import urllib.parse
+
+from huhhttp import template
+from huhhttp.post import POSTS
+from huhhttp.server import Router
+from huhhttp.site import HANDLERS
+
+
+LINK_RE = re.compile(r'''(?:HREF|SRC)\s*=\s*["']?\s*([^"'\s>]+)''', re.I)
+
+
+def site_paths():
+    texts = [
+        value for name, value in vars(template).items()
+        if name.isupper() and isinstance(value, str)
+    ]
+    texts.extend(POSTS.values())
+    paths = []
+
+    for text in texts:
+        for link in LINK_RE.findall(text):
+            try:
+                url = urllib.parse.urljoin('http://localhost/', link)
+                parts = urllib.parse.urlsplit(url)
+            except ValueError:
+                continue
+
+            if parts.hostname == 'localhost' and parts.path:
+                paths.append(parts.path.encode('utf8'))
+
+    for year, month, day in sorted(POSTS):
+        paths.append('/wirdpress/post/{}/{}/{}/slug'.format(
+            year, month, day).encode('ascii'))
+        paths.append('/wirdpress/calendar/{}/{}/{}/'.format(
+            year, month, day).encode('ascii'))
+
+    return paths
+
+
+def linear_match(path):
+    for pattern, handler_class in HANDLERS:
+        match = re.fullmatch(pattern, path)
+
+        if match:
+            return handler_class, match
+
+    return None, None
+
+
+def main():
+    paths = site_paths()
+    router = Router(HANDLERS)
+
+    for path in paths:
+        expected_class, expected_match = linear_match(path)
+        handler_class, match = router.match(path)
+        assert handler_class is expected_class, path
+        assert match.groups() == expected_match.groups(), path
+
+    print('{} paths'.format(len(paths)))
+
+    for name, func in (('linear', linear_match), ('router', router.match)):
+        def run():
+            for path in paths:
+                func(path)
+
+        number = 200
+        best = min(timeit.repeat(run, number=number, repeat=5))
+        print('{:<8} {:8.2f} us/lookup'.format(
+            name, best / number / len(paths) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,34 @@
 import argparse
 import asyncio
+import concurrent.futures
+import functools
+import hashlib
 import logging
-import time
+import sys
 
 import huhhttp
+from huhhttp.admission import AdmissionControl, CompressionControl, \
+    LoopLagMonitor
+from huhhttp.assetcache import AssetCache
+from huhhttp.compress import FLUSH_MODES
+from huhhttp.corpus import SqliteCorpus
 from huhhttp.fuzz import Fuzzer
+from huhhttp.protocol import start_buffered_server
+from huhhttp.server import GenerationServer
 from huhhttp.site import SiteServer
+from huhhttp.worker import WorkerPool
 
 
 _logger = logging.getLogger(__name__)
 
+SERVER_CORES = {
+    'stream': asyncio.start_server,
+    'protocol': start_buffered_server,
+}
+ETAG_ALGORITHMS = sorted(
+    name for name in hashlib.algorithms_guaranteed
+    if not name.startswith('shake_'))
+
 
 def main():
     arg_parser = argparse.ArgumentParser()
@@ -18,29 +37,192 @@ def main():
     arg_parser.add_argument('--seed', default=1, type=int)
     arg_parser.add_argument('--fuzz-period', default=500, type=int)
     arg_parser.add_argument('--restart-interval', default=10000, type=int)
+    arg_parser.add_argument(
+        '--workers', default=1, type=int,
+        help='number of processes sharing the port with SO_REUSEPORT')
+    arg_parser.add_argument(
+        '--drain-timeout', default=30, type=float,
+        help='seconds a retired server generation may keep its connections')
+    arg_parser.add_argument(
+        '--core', default='stream', choices=sorted(SERVER_CORES),
+        help='use asyncio streams or buffered protocols for connections')
+    arg_parser.add_argument(
+        '--pipeline-depth', default=8, type=int,
+        help='requests parsed ahead of their responses on one connection')
+    arg_parser.add_argument(
+        '--max-connections', type=int,
+        help='connections served at once before shedding load')
+    arg_parser.add_argument(
+        '--max-handlers', type=int,
+        help='requests handled at once before shedding load')
+    arg_parser.add_argument(
+        '--max-lag', type=float,
+        help='event loop lag in seconds before shedding load')
+    arg_parser.add_argument(
+        '--overload-action', default='respond',
+        choices=AdmissionControl.ACTIONS,
+        help='what to do with connections or requests over a limit')
+    arg_parser.add_argument(
+        '--write-high-water', type=int,
+        help='bytes buffered by a connection before writes wait to drain')
+    arg_parser.add_argument(
+        '--write-low-water', type=int,
+        help='bytes buffered by a connection when writes resume')
+    arg_parser.add_argument(
+        '--fragmented-writes', action='store_true',
+        help='write and drain every response fragment separately')
+    arg_parser.add_argument(
+        '--etag-algorithm', default='sha1', choices=ETAG_ALGORITHMS,
+        help='hash used for the ETag of buffered responses')
+    arg_parser.add_argument(
+        '--compress-level', default=6, type=int, choices=range(10),
+        metavar='0-9', help='zlib level of compressed responses')
+    arg_parser.add_argument(
+        '--compress-flush', default='none', choices=sorted(FLUSH_MODES),
+        help='flush the compressor after every write of content')
+    arg_parser.add_argument(
+        '--compress-offload-size', default=65536, type=int,
+        help='bytes compressed at once in a thread instead of the event '
+             'loop, 0 to never use threads')
+    arg_parser.add_argument(
+        '--compress-threads', type=int,
+        help='threads for compression, default the event loop executor')
+    arg_parser.add_argument(
+        '--adaptive-compression', action='store_true',
+        help='lower the compression level as event loop lag and queued '
+             'compression grow')
+    arg_parser.add_argument(
+        '--dquery-block-size', default=1000, type=int,
+        help='variables of /images/dquery-max.js written at a time')
+    arg_parser.add_argument(
+        '--asset-file-size', default=4 * 1024 * 1024, type=int,
+        help='bytes of the largest asset kept in memory, larger assets are '
+             'sent from their files, 0 to send all assets from their files')
+    arg_parser.add_argument(
+        '--corpus',
+        help='SQLite post corpus made by python -m huhhttp.corpus')
 
     args = arg_parser.parse_args()
 
+    if args.workers < 1:
+        arg_parser.error('--workers must be at least 1')
+
+    if args.core == 'protocol' and sys.version_info < (3, 7):
+        arg_parser.error('--core protocol needs Python 3.7 or greater')
+
+    if args.pipeline_depth < 1:
+        arg_parser.error('--pipeline-depth must be at least 1')
+
+    if args.max_connections is not None and args.max_connections < 1:
+        arg_parser.error('--max-connections must be at least 1')
+
+    if args.max_handlers is not None and args.max_handlers < 1:
+        arg_parser.error('--max-handlers must be at least 1')
+
+    if args.write_high_water is not None and args.write_high_water < 0:
+        arg_parser.error('--write-high-water must be at least 0')
+
+    if args.write_low_water is not None and args.write_low_water < 0:
+        arg_parser.error('--write-low-water must be at least 0')
+
+    if args.write_high_water is not None and \
+            args.write_low_water is not None and \
+            args.write_low_water > args.write_high_water:
+        arg_parser.error(
+            '--write-low-water must not be more than --write-high-water')
+
+    if args.compress_threads is not None and args.compress_threads < 1:
+        arg_parser.error('--compress-threads must be at least 1')
+
+    if args.dquery_block_size < 1:
+        arg_parser.error('--dquery-block-size must be at least 1')
+
+    if args.asset_file_size < 0:
+        arg_parser.error('--asset-file-size must be at least 0')
+
     logging.basicConfig(level=logging.INFO)
 
-    fuzzer = Fuzzer(seed=args.seed, period=args.fuzz_period)
-    _logger.info('Version %s, Seed %s, Period %s, Interval %s',
+    _logger.info('Version %s, Seed %s, Period %s, Interval %s, Workers %s, '
+                 'Core %s',
                  huhhttp.__version__,
-                 args.seed, args.fuzz_period, args.restart_interval)
+                 args.seed, args.fuzz_period, args.restart_interval,
+                 args.workers, args.core)
+
+    if args.workers > 1:
+        pool = WorkerPool(args.workers, functools.partial(run_server, args))
+        pool.run()
+    else:
+        run_server(args)
+
+
+def run_server(args, worker_index=0):
+    fuzzer = Fuzzer.for_worker(worker_index, args.workers,
+                               seed=args.seed, period=args.fuzz_period)
+
+    if args.workers > 1:
+        _logger.info('Worker %d, Seed %s, Counter %d step %d',
+                     worker_index, fuzzer.seed, fuzzer.counter,
+                     fuzzer.counter_step)
+
+    if args.max_lag is not None or args.adaptive_compression:
+        lag_monitor = LoopLagMonitor()
+        lag_monitor.start()
+    else:
+        lag_monitor = None
+
+    if args.max_connections is not None or \
+            args.max_handlers is not None or args.max_lag is not None:
+        admission = AdmissionControl(
+            max_connections=args.max_connections,
+            max_handlers=args.max_handlers,
+            max_lag=args.max_lag,
+            action=args.overload_action,
+            lag_monitor=lag_monitor)
+    else:
+        admission = None
+
+    if args.compress_threads:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.compress_threads)
+    else:
+        executor = None
 
-    while True:
-        server_callback = SiteServer(fuzzer,
-                                     restart_interval=args.restart_interval)
-        task = asyncio.start_server(server_callback, host=args.host,
-                                    port=args.port)
+    compression = CompressionControl(
+        level=args.compress_level,
+        offload_size=args.compress_offload_size,
+        executor=executor,
+        adaptive=args.adaptive_compression,
+        lag_monitor=lag_monitor)
 
-        server = asyncio.get_event_loop().run_until_complete(task)
-        server_callback.asyncio_server = server
+    if args.corpus:
+        corpus = SqliteCorpus(args.corpus)
+    else:
+        corpus = None
 
-        asyncio.get_event_loop().run_forever()
+    server_callback = GenerationServer(
+        functools.partial(SiteServer, fuzzer,
+                          restart_interval=args.restart_interval,
+                          corpus=corpus,
+                          site_seed=args.seed,
+                          dquery_block_size=args.dquery_block_size,
+                          compression=compression,
+                          compress_flush_mode=FLUSH_MODES[
+                              args.compress_flush],
+                          asset_cache=AssetCache(
+                              max_file_size=args.asset_file_size),
+                          max_pipeline_depth=args.pipeline_depth,
+                          admission=admission,
+                          write_high_water=args.write_high_water,
+                          write_low_water=args.write_low_water,
+                          fragmented_writes=args.fragmented_writes,
+                          etag_algorithm=args.etag_algorithm),
+        drain_timeout=args.drain_timeout)
+    start_server = SERVER_CORES[args.core]
+    task = start_server(server_callback, host=args.host, port=args.port,
+                        reuse_port=args.workers > 1)
 
-        _logger.debug('Sleeping')
-        time.sleep(1)
+    asyncio.get_event_loop().run_until_complete(task)
+    asyncio.get_event_loop().run_forever()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+'''Connection admission control and load shedding.'''
+import asyncio
+import collections
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+OVERLOADED_RESPONSE = (
+    b'HTTP/1.1 503 Smaug is busy\r\n'
+    b'Retry-After: 1\r\n'
+    b'Content-Length: 0\r\n'
+    b'Connection: close\r\n'
+    b'\r\n'
+)
+
+
+class LoopLagMonitor(object):
+    '''Task that measures how late the event loop wakes it up.'''
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.lag = 0.0
+        self.listeners = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @asyncio.coroutine
+    def _run(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            start_time = loop.time()
+            yield from asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start_time - self.interval)
+
+            for listener in self.listeners:
+                listener()
+
+
+class AdmissionControl(object):
+    '''Limits on connections, running handlers and event loop lag.
+
+    Work over a limit is handled by ``action``. ``defer`` waits up to
+    ``defer_timeout`` seconds for room and then responds, ``refuse`` closes
+    the connection and ``respond`` sends :data:`OVERLOADED_RESPONSE`. Each
+    decision is counted in :attr:`stats`.
+    '''
+    ACTIONS = ('defer', 'refuse', 'respond')
+
+    def __init__(self, max_connections=None, max_handlers=None,
+                 max_lag=None, action='respond', defer_timeout=5,
+                 lag_monitor=None):
+        assert action in self.ACTIONS, action
+        assert max_lag is None or lag_monitor
+
+        self.limits = {
+            'connection': max_connections,
+            'handler': max_handlers,
+        }
+        self.counts = {
+            'connection': 0,
+            'handler': 0,
+        }
+        self.max_lag = max_lag
+        self.action = action
+        self.defer_timeout = defer_timeout
+        self.lag_monitor = lag_monitor
+        self.stats = collections.Counter()
+        self._waiters = []
+
+        if lag_monitor:
+            lag_monitor.listeners.append(self._lag_updated)
+
+    @property
+    def lagging(self):
+        return self.max_lag is not None and self.lag_monitor.lag > self.max_lag
+
+    def has_room(self, kind):
+        limit = self.limits[kind]
+        return (limit is None or self.counts[kind] < limit) and \
+            not self.lagging
+
+    @asyncio.coroutine
+    def admit(self, kind, writer):
+        '''Take a slot for a connection or handler.
+
+        Returns False if the work was shed. The connection is closed in
+        that case.
+        '''
+        if self.has_room(kind):
+            self.counts[kind] += 1
+            return True
+
+        action = self.action
+
+        if action == 'defer':
+            self.stats[kind + '_deferred'] += 1
+
+            if (yield from self._wait_for_room(kind)):
+                self.counts[kind] += 1
+                return True
+
+            self.stats[kind + '_defer_timeout'] += 1
+            action = 'respond'
+
+        if action == 'refuse':
+            self.stats[kind + '_refused'] += 1
+        else:
+            self.stats[kind + '_responded'] += 1
+            writer.write(OVERLOADED_RESPONSE)
+
+        _logger.debug('Shed %s: %s', kind, action)
+        writer.close()
+        return False
+
+    def release(self, kind):
+        self.counts[kind] -= 1
+        self._notify()
+
+    @asyncio.coroutine
+    def _wait_for_room(self, kind):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.defer_timeout
+
+        while not self.has_room(kind):
+            timeout = deadline - loop.time()
+
+            if timeout <= 0:
+                return False
+
+            waiter = asyncio.Future()
+            self._waiters.append(waiter)
+
+            try:
+                yield from asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return True
+
+    def _notify(self):
+        waiters = self._waiters
+        self._waiters = []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _lag_updated(self):
+        if self.lagging:
+            _logger.info('Event loop lag %.3fs. Shed so far: %s',
+                         self.lag_monitor.lag, dict(self.stats))
+        elif self._waiters:
+            self._notify()
+
+
+class CompressionControl(object):
+    '''Compression level and where compression runs under load.
+
+    Compression of at least ``offload_size`` bytes runs in ``executor``
+    (the loop's default executor if None) since zlib releases the GIL.
+    If ``adaptive``, :meth:`level` lowers ``level`` by one for every
+    ``lag_step`` seconds of event loop lag and every ``queue_step`` jobs
+    in the executor, down to ``min_level``.
+    '''
+    def __init__(self, level=6, offload_size=65536, executor=None,
+                 adaptive=False, min_level=1, lag_step=0.05, queue_step=4,
+                 lag_monitor=None):
+        assert not adaptive or lag_monitor
+
+        self.base_level = level
+        self.offload_size = offload_size
+        self.executor = executor
+        self.adaptive = adaptive
+        self.min_level = min(min_level, level)
+        self.lag_step = lag_step
+        self.queue_step = queue_step
+        self.lag_monitor = lag_monitor
+        self.pending = 0
+        self.stats = collections.Counter()
+
+    def level(self):
+        '''Return the level for a new compressor.'''
+        if not self.adaptive:
+            return self.base_level
+
+        steps = int(self.lag_monitor.lag / self.lag_step) + \
+            self.pending // self.queue_step
+        level = max(self.min_level, self.base_level - steps)
+
+        if level != self.base_level:
+            self.stats['lowered'] += 1
+
+        return level
+
+    @asyncio.coroutine
+    def run(self, size, func, *args):
+        '''Call a compression function, in the executor if size is large.'''
+        if not self.offload_size or size < self.offload_size:
+            return func(*args)
+
+        self.pending += 1
+        self.stats['offloaded'] += 1
+
+        try:
+            return (yield from asyncio.get_event_loop().run_in_executor(
+                self.executor, func, *args))
+        finally:
+            self.pending -= 1
@@ -0,0 +1,127 @@
+'''In-memory cache of static asset files.'''
+import collections
+import os
+import stat
+import time
+
+from huhhttp.header import format_date
+
+
+class Asset(object):
+    '''A file with its validators and, if it is small enough, its contents.
+
+    Compressed encodings of the contents are kept in :attr:`encodings` by
+    compressor class and level.
+    '''
+    def __init__(self, path, stat_result, data=None):
+        self.path = path
+        self.mtime = stat_result.st_mtime
+        self.size = stat_result.st_size
+        self.data = data
+        self.last_modified = format_date(self.mtime)
+        self.etag = '{:x}-{:x}'.format(
+            int(self.mtime), self.size).encode('ascii')
+        self.checked = time.monotonic()
+        self.encodings = {}
+
+    @property
+    def cost(self):
+        return len(self.data or b'') + \
+            sum(len(data) for data in self.encodings.values())
+
+
+class AssetCache(object):
+    '''Least recently used cache of :class:`Asset`.
+
+    A file is checked again with ``os.stat`` at most every
+    ``stat_interval`` seconds and reloaded when its modification time or
+    size changed. Contents of files larger than ``max_file_size`` are not
+    kept. The oldest entries are dropped when the contents held add up to
+    more than ``max_size`` bytes.
+    '''
+    def __init__(self, max_size=32 * 1024 * 1024,
+                 max_file_size=4 * 1024 * 1024, stat_interval=1.0):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.stat_interval = stat_interval
+        self._assets = collections.OrderedDict()
+
+    def get(self, path):
+        '''Return the asset of a path or None if it is not a regular file.'''
+        asset = self._assets.get(path)
+
+        if asset:
+            now = time.monotonic()
+
+            if now - asset.checked < self.stat_interval:
+                self._assets.move_to_end(path)
+                return asset
+
+            stat_result = self._stat(path)
+
+            if stat_result and stat_result.st_mtime == asset.mtime and \
+                    stat_result.st_size == asset.size:
+                asset.checked = now
+                self._assets.move_to_end(path)
+                return asset
+
+            del self._assets[path]
+        else:
+            stat_result = self._stat(path)
+
+        if not stat_result:
+            return None
+
+        if stat_result.st_size <= self.max_file_size:
+            with open(path, 'rb') as file:
+                data = file.read()
+        else:
+            data = None
+
+        asset = self._assets[path] = Asset(path, stat_result, data)
+        self.evict()
+
+        return asset
+
+    def get_encoding(self, asset, compressor_class, level=6,
+                     any_level=False):
+        '''Return the level and compressed contents of an asset or None.
+
+        If ``any_level`` is set, contents compressed at another level are
+        returned if there are none at ``level``.
+        '''
+        data = asset.encodings.get((compressor_class, level))
+
+        if data is not None:
+            return level, data
+
+        if not any_level:
+            return None
+
+        for (other_class, other_level), data in asset.encodings.items():
+            if other_class is compressor_class:
+                return other_level, data
+
+    def put_encoding(self, asset, compressor_class, level, data):
+        asset.encodings[(compressor_class, level)] = data
+        self.evict()
+
+    def evict(self):
+        size = sum(asset.cost for asset in self._assets.values())
+
+        while size > self.max_size and len(self._assets) > 1:
+            path, asset = self._assets.popitem(last=False)
+            size -= asset.cost
+
+    def clear(self):
+        self._assets.clear()
+
+    @classmethod
+    def _stat(cls, path):
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+
+        if stat.S_ISREG(stat_result.st_mode):
+            return stat_result
@@ -0,0 +1,203 @@
+'''Decompression bombs built from repeated compressed blocks.
+
+A stream is a head, a unit repeated many times and a tail. Compressing
+such a stream only compresses the head, one block of units and the tail.
+Each is its own run of non-final deflate blocks ending at a byte
+boundary, so the compressed unit can be repeated as is. The checksums
+in the trailer are worked out from the checksums of the pieces without
+going over the repeated data.
+'''
+import functools
+import random
+import struct
+import zlib
+
+
+ADLER32_BASE = 65521
+CRC32_ONE_ZERO_BIT = [0xedb88320] + [1 << bit for bit in range(31)]
+CRC32_IDENTITY = [1 << bit for bit in range(32)]
+
+GZIP_HEADER = struct.pack('<BBBBLBB', 0x1f, 0x8b, zlib.DEFLATED, 0, 0, 2, 255)
+ZLIB_HEADER = b'\x78\xda'
+FINAL_BLOCK = b'\x03\x00'
+ENCODINGS = ('gzip', 'deflate', 'chained')
+UNIT_SIZE = 1024 * 1024
+MAX_RATIO = 1024
+MAX_DEPTH = 4
+
+
+def _gf2_times(matrix, vector):
+    result = 0
+    index = 0
+
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+
+        vector >>= 1
+        index += 1
+
+    return result
+
+
+def _gf2_multiply(matrix_1, matrix_2):
+    return [_gf2_times(matrix_1, column) for column in matrix_2]
+
+
+def _crc32_zeros_operator(length):
+    '''Return the matrix that feeds length zero bytes to a CRC-32.'''
+    result = CRC32_IDENTITY
+    matrix = CRC32_ONE_ZERO_BIT
+    bits = length * 8
+
+    while bits:
+        if bits & 1:
+            result = _gf2_multiply(matrix, result)
+
+        matrix = _gf2_multiply(matrix, matrix)
+        bits >>= 1
+
+    return result
+
+
+def crc32_repeat(data, count, crc=0):
+    '''Return the CRC-32 of data repeated count times, continuing crc.
+
+    Feeding data to a CRC-32 is an affine map of the register, so it is
+    raised to the power of count by squaring.
+    '''
+    matrix = _crc32_zeros_operator(len(data))
+    constant = zlib.crc32(data)
+
+    while count:
+        if count & 1:
+            crc = _gf2_times(matrix, crc) ^ constant
+
+        constant = _gf2_times(matrix, constant) ^ constant
+        matrix = _gf2_multiply(matrix, matrix)
+        count >>= 1
+
+    return crc
+
+
+def adler32_combine(adler_1, adler_2, length_2):
+    '''Return the Adler-32 of two pieces of data from theirs.'''
+    sum_a = ((adler_1 & 0xffff) + (adler_2 & 0xffff) - 1) % ADLER32_BASE
+    sum_b = ((adler_1 >> 16) + (adler_2 >> 16) +
+             length_2 * ((adler_1 & 0xffff) - 1)) % ADLER32_BASE
+
+    return (sum_b << 16) | sum_a
+
+
+def adler32_repeat(data, count, adler=1):
+    '''Return the Adler-32 of data repeated count times, continuing adler.'''
+    value = zlib.adler32(data)
+    length = len(data)
+
+    while count:
+        if count & 1:
+            adler = adler32_combine(adler, value, length)
+
+        value = adler32_combine(value, value, length)
+        length *= 2
+        count >>= 1
+
+    return adler
+
+
+def deflate_block(data, level=9):
+    '''Return data as raw deflate blocks that end at a byte boundary.'''
+    if not data:
+        return b''
+
+    compress_obj = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compress_obj.compress(data) + compress_obj.flush(zlib.Z_FULL_FLUSH)
+
+
+class Layer(object):
+    '''A stream of ``head``, ``unit`` repeated ``count`` times and ``tail``.'''
+    def __init__(self, head, unit, count, tail):
+        self.head = head
+        self.unit = unit
+        self.count = count
+        self.tail = tail
+
+    @property
+    def size(self):
+        return len(self.head) + len(self.unit) * self.count + len(self.tail)
+
+    def crc32(self):
+        crc = crc32_repeat(self.unit, self.count, zlib.crc32(self.head))
+        return zlib.crc32(self.tail, crc)
+
+    def adler32(self):
+        adler = adler32_repeat(self.unit, self.count, zlib.adler32(self.head))
+        return zlib.adler32(self.tail, adler)
+
+    def compress(self, encoding):
+        '''Return the layer compressed as gzip or deflate.
+
+        Units are compressed in groups of about ``UNIT_SIZE`` bytes. The
+        units left over go into the tail.
+        '''
+        units_per_block = max(1, UNIT_SIZE // len(self.unit))
+        count, extra = divmod(self.count, units_per_block)
+
+        head = deflate_block(self.head)
+        unit = deflate_block(self.unit * units_per_block)
+        tail = deflate_block(self.unit * extra + self.tail) + FINAL_BLOCK
+
+        if encoding == 'gzip':
+            head = GZIP_HEADER + head
+            tail += struct.pack('<LL', self.crc32(), self.size & 0xffffffff)
+        else:
+            head = ZLIB_HEADER + head
+            tail += struct.pack('>L', self.adler32())
+
+        return Layer(head, unit, count, tail)
+
+
+def content_unit(ratio):
+    '''Return ``UNIT_SIZE`` bytes that deflate by about ratio.
+
+    The unit is random bytes, which do not compress, followed by zeros,
+    which compress by about ``MAX_RATIO``.
+    '''
+    random_size = int(max(0.0, UNIT_SIZE / ratio - UNIT_SIZE / MAX_RATIO) /
+                      (1 - 1 / MAX_RATIO))
+    random_size = min(UNIT_SIZE, random_size)
+
+    if random_size:
+        noise = random.Random(random_size).getrandbits(
+            8 * random_size).to_bytes(random_size, 'little')
+    else:
+        noise = b''
+
+    return noise + bytes(UNIT_SIZE - random_size)
+
+
+@functools.lru_cache(maxsize=16)
+def make_bomb(size, ratio=MAX_RATIO, depth=1, encoding='gzip'):
+    '''Return the compressed layer and the codings applied, innermost first.
+
+    ``size`` bytes of content deflate by about ``ratio`` and are compressed
+    ``depth`` times. Chained bombs alternate gzip and deflate.
+    '''
+    assert encoding in ENCODINGS, encoding
+    assert 1 <= depth <= MAX_DEPTH, depth
+
+    unit = content_unit(ratio)
+    count, extra = divmod(size, len(unit))
+    layer = Layer(b'', unit, count, unit[:extra])
+    codings = ()
+
+    for index in range(depth):
+        if encoding == 'chained':
+            coding = ('gzip', 'deflate')[index % 2]
+        else:
+            coding = encoding
+
+        layer = layer.compress(coding)
+        codings += (coding,)
+
+    return layer, codings
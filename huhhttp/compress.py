@@ -1,50 +1,90 @@
-import gzip
-import io
-import zlib
+'''Streaming compressors for response content.
 
+Each compressor returns the compressed bytes that are ready for every
+write. With a flush mode other than ``Z_NO_FLUSH``, the output of a write
+ends at a byte boundary and can be decompressed without the rest.
+'''
+import struct
+import zlib
 
-class GzipCompressor(object):
-    def __init__(self):
-        self._buffer = io.BytesIO()
-        self._gzip_file = gzip.GzipFile(
-            mode='wb', compresslevel=6, fileobj=self._buffer)
 
-    def write(self, data):
-        self._gzip_file.write(data)
-        new_data = self._buffer.getvalue()
-        self._buffer.seek(0)
-        self._buffer.truncate()
-        return new_data
-
-    def close(self):
-        self._gzip_file.close()
-        new_data = self._buffer.getvalue()
-        self._buffer.close()
-        return new_data
+FLUSH_MODES = {
+    'none': zlib.Z_NO_FLUSH,
+    'sync': zlib.Z_SYNC_FLUSH,
+    'full': zlib.Z_FULL_FLUSH,
+}
 
 
 class DeflateCompressor(object):
-    def __init__(self):
-        self._compress_obj = zlib.compressobj(6)
+    '''Deflate stream in zlib format.'''
+    WBITS = zlib.MAX_WBITS
+
+    def __init__(self, level=6, flush_mode=zlib.Z_NO_FLUSH):
+        self.level = level
+        self.flush_mode = flush_mode
+        self._compress_obj = zlib.compressobj(
+            level, zlib.DEFLATED, self.WBITS)
 
     def write(self, data):
-        return self._compress_obj.compress(data)
+        if self.flush_mode == zlib.Z_NO_FLUSH:
+            return self._compress_obj.compress(data)
+
+        return self._compress_obj.compress(data) + \
+            self._compress_obj.flush(self.flush_mode)
 
     def close(self):
         return self._compress_obj.flush()
 
 
-class RawDeflateCompressor(object):
-    def __init__(self):
-        self._compress_obj = zlib.compressobj(6)
-        self._header_written = False
+class RawDeflateCompressor(DeflateCompressor):
+    '''Deflate stream without the zlib header and trailer.'''
+    WBITS = -zlib.MAX_WBITS
 
-    def write(self, data):
-        if self._header_written:
-            return self._compress_obj.compress(data)
+
+class GzipCompressor(RawDeflateCompressor):
+    '''Deflate stream framed as a gzip member.
+
+    The header has no file name and a modification time of zero, so that
+    the same content always compresses to the same bytes.
+    '''
+    def __init__(self, level=6, flush_mode=zlib.Z_NO_FLUSH):
+        super().__init__(level=level, flush_mode=flush_mode)
+        self._crc = 0
+        self._size = 0
+
+        if level == zlib.Z_BEST_COMPRESSION:
+            extra_flags = 2
+        elif level == zlib.Z_BEST_SPEED:
+            extra_flags = 4
         else:
-            self._header_written = True
-            return self._compress_obj.compress(data)[2:]
+            extra_flags = 0
+
+        self._header = struct.pack('<BBBBLBB', 0x1f, 0x8b, zlib.DEFLATED,
+                                   0, 0, extra_flags, 255)
+
+    def write(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        new_data = super().write(data)
+
+        if self._header:
+            new_data = self._header + new_data
+            self._header = None
+
+        return new_data
 
     def close(self):
-        return self._compress_obj.flush()[:-4]
+        new_data = super().close() + struct.pack(
+            '<LL', self._crc, self._size & 0xffffffff)
+
+        if self._header:
+            new_data = self._header + new_data
+            self._header = None
+
+        return new_data
+
+
+def compress_data(compressor_class, data, level=6):
+    '''Return the whole of data compressed by a new compressor.'''
+    compressor = compressor_class(level=level)
+    return compressor.write(data) + compressor.close()
@@ -0,0 +1,187 @@
+'''Post corpora kept in SQLite databases, and a generator for them.
+
+A corpus provides the methods of :class:`huhhttp.post.PostIndex`. Generate
+a database with ``python -m huhhttp.corpus PATH --count N`` and serve it
+with ``--corpus PATH``.
+'''
+import argparse
+import datetime
+import functools
+import logging
+import random
+import re
+import sqlite3
+
+from huhhttp.post import POSTS, post_content_to_url_slug
+
+
+_logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE posts (
+    position INTEGER PRIMARY KEY,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE UNIQUE INDEX posts_date ON posts (year, month, day);
+'''
+
+
+class SqliteCorpus(object):
+    '''Posts read on demand from a database made by :func:`generate_corpus`.
+
+    Posts are found through the date index and pages of the listing
+    through their positions, so each lookup is a B-tree search. Memory is
+    bounded by SQLite's page cache of ``cache_size`` KiB and an LRU cache
+    of ``row_cache_size`` posts.
+    '''
+    RECENT_COUNT = 3
+    PAGE_SIZE = 100
+
+    def __init__(self, path, cache_size=8192, row_cache_size=1024):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA query_only = 1')
+        self._connection.execute(
+            'PRAGMA cache_size = -{}'.format(int(cache_size)))
+        self._row = functools.lru_cache(maxsize=row_cache_size)(
+            self._fetch_row)
+
+        self._count = self._connection.execute(
+            'SELECT COALESCE(MAX(position) + 1, 0) FROM posts').fetchone()[0]
+        self.recent_posts = self._items(0, self.RECENT_COUNT)
+
+        _logger.info('Corpus %s has %d posts', path, self._count)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def page_count(self):
+        return max(1, -(-self._count // self.PAGE_SIZE))
+
+    def listing(self, page):
+        if 1 <= page <= self.page_count:
+            return self._items((page - 1) * self.PAGE_SIZE, self.PAGE_SIZE)
+
+    def get(self, key):
+        row = self._row(key)
+
+        if row:
+            return row[2]
+
+    def url(self, key):
+        return self._row(key)[1]
+
+    def prev_key(self, key):
+        '''Return the key of the previous post.
+
+        The first post is its own previous post.
+        '''
+        row = self._row(key)
+
+        if row:
+            return self._key_at(max(0, row[0] - 1))
+
+    def next_key(self, key):
+        row = self._row(key)
+
+        if row:
+            return self._key_at(row[0] + 1)
+
+    def close(self):
+        self._connection.close()
+
+    def _fetch_row(self, key):
+        return self._connection.execute(
+            'SELECT position, url, content FROM posts '
+            'WHERE year = ? AND month = ? AND day = ?', key).fetchone()
+
+    def _key_at(self, position):
+        return self._connection.execute(
+            'SELECT year, month, day FROM posts WHERE position = ?',
+            (position,)).fetchone()
+
+    def _items(self, position, count):
+        return ''.join(
+            '<LI><A HREF="{}">{}</A>'.format(url, title)
+            for url, title in self._connection.execute(
+                'SELECT url, title FROM posts '
+                'WHERE position >= ? AND position < ? ORDER BY position',
+                (position, position + count))
+        )
+
+
+def generate_corpus(path, count, seed=1, start=datetime.date(1997, 2, 9),
+                    batch_size=10000):
+    '''Write a new database with one synthetic post a day from ``start``.
+
+    The posts are made of words from the built-in posts and are the same
+    for the same ``seed``.
+    '''
+    max_count = (datetime.date.max - start).days + 1
+
+    if count > max_count:
+        raise ValueError('At most {} posts fit before year 10000'
+                         .format(max_count))
+
+    rand = random.Random(seed)
+    words = re.findall(r"[A-Za-z']+", ' '.join(POSTS.values()))
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.executescript(SCHEMA)
+
+    def rows():
+        for position in range(count):
+            date = start + datetime.timedelta(days=position)
+            paragraphs = []
+
+            for dummy in range(rand.randint(1, 5)):
+                paragraphs.append('\n    <P>' + ' '.join(
+                    rand.choice(words)
+                    for dummy in range(rand.randint(8, 60))))
+
+            content = ''.join(paragraphs) + '\n    '
+            url = 'wirdpress/post/{}/{}/{}/{}'.format(
+                date.year, date.month, date.day,
+                post_content_to_url_slug(content))
+
+            yield (position, date.year, date.month, date.day, url,
+                   content[:60], content)
+
+    generator = rows()
+
+    with connection:
+        while True:
+            batch = [row for dummy, row in zip(range(batch_size), generator)]
+
+            if not batch:
+                break
+
+            connection.executemany(
+                'INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+            _logger.info('Wrote %d posts', batch[-1][0] + 1)
+
+    connection.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Generate a synthetic post corpus.')
+    arg_parser.add_argument('path')
+    arg_parser.add_argument('--count', default=100000, type=int)
+    arg_parser.add_argument('--seed', default=1, type=int)
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate_corpus(args.path, args.count, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
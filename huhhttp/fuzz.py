@@ -166,14 +166,35 @@ class CompressType(enum.Enum):
     raw_default = 'raw_deflate'
 
 
+class RangeFault(enum.Enum):
+    off_by_one = 'off_by_one'
+    wrong_total = 'wrong_total'
+    unterminated = 'unterminated'
+
+
 class Fuzzer(object):
-    def __init__(self, seed=1, period=1000):
+    def __init__(self, seed=1, period=1000, counter=0, counter_step=1):
+        self.seed = seed
         self._rand = random.Random(seed)
         self._threshold_func = PeriodicGaussianFunction(period=period)
-        self._counter = 0
+        self._counter = counter
+        self._counter_step = counter_step
         self._mangle_config = MangleConfig(rand=self._rand)
         self._auto_mangle = AutoMangle(self._mangle_config)
 
+    @classmethod
+    def for_worker(cls, index, num_workers, seed=1, period=1000):
+        '''Return the fuzzer for one slice of a multi-process run.
+
+        Worker ``index`` of ``num_workers`` uses the counters
+        ``index, index + num_workers, ...`` and its own seed so that the
+        workers never overlap and a run can be replayed with the same
+        number of workers.
+        '''
+        assert 0 <= index < num_workers
+        return cls(seed=seed * num_workers + index, period=period,
+                   counter=index, counter_step=num_workers)
+
     @property
     def counter(self):
         return self._counter
@@ -182,25 +203,31 @@ class Fuzzer(object):
     def counter(self, value):
         self._counter = value
 
+    @property
+    def counter_step(self):
+        return self._counter_step
+
     def _next_threshold(self):
         value = self._threshold_func.value(self._counter)
-        self._counter += 1
+        self._counter += self._counter_step
         return value
 
     def session(self):
         counter = self._counter
         next_threshold = self._next_threshold()
         return FuzzSession(self._mangle_config, self._auto_mangle, self._rand,
-                           next_threshold, counter)
+                           next_threshold, counter, self._counter_step)
 
 
 class FuzzSession(object):
-    def __init__(self, mangle_config, auto_mangle, rand, threshold, counter):
+    def __init__(self, mangle_config, auto_mangle, rand, threshold, counter,
+                 counter_step=1):
         self._mangle_config = mangle_config
         self._auto_mangle = auto_mangle
         self._rand = rand
         self._threshold = threshold
         self._counter = counter
+        self._counter_step = counter_step
 
     @property
     def threshold(self):
@@ -236,8 +263,17 @@ class FuzzSession(object):
             else:
                 return CompressType.gzip
 
+    def range_fault(self):
+        if self._rand.random() < self._threshold * 0.5:
+            return self._rand.choice(tuple(RangeFault))
+
+    @property
+    def mangles(self):
+        '''True for every fifth session of the fuzzer that made it.'''
+        return self._counter // self._counter_step % 5 == 0
+
     def mangle(self, data):
-        if self._counter % 5 != 0:
+        if not self.mangles:
             return data
 
         self._auto_mangle.aggressivity = self._threshold * 0.75
@@ -1,17 +1,23 @@
 import asyncio
 import hashlib
-import io
+import os
 import socket
 import struct
 
 from huhhttp.header import Response
 
 
+ETAG_CACHE = {}
+ETAG_CACHE_SIZE = 1024
+
+
 class StopProcessing(Exception):
     pass
 
 
 class Handler(object):
+    MAX_BUFFER_SIZE = 10000
+
     def __init__(self, server, reader, writer, request, match):
         self.server = server
         self.reader = reader
@@ -22,8 +28,12 @@ class Handler(object):
         self.closed = False
         self.streaming = False
         self.buffer = None
-        self.buffer_hash = None
+        self.buffer_length = 0
+        self.etag_key = None
+        self.content_sent = False
         self.allowed_methods = (b'GET', b'HEAD')
+        self._pending_head = None
+        self._high_water = writer.transport.get_write_buffer_limits()[1]
 
     def __call__(self):
         try:
@@ -48,42 +58,109 @@ class Handler(object):
     def finish(self):
         if self.streaming:
             yield from self.write(b'0\r\n\r\n')
-        elif self.response:
+        elif self.response and not self.content_sent:
             if b'Content-Length' not in self.response.fields:
                 self.response.fields[b'Content-Length'] = str(
-                    self.buffer.tell()).encode('ascii')
+                    self.buffer_length).encode('ascii')
 
-            if b'Etag' not in self.response.fields and self.buffer_hash:
-                self.response.fields[b'Etag'] = self.buffer_hash.hexdigest(
-                    ).encode('ascii')
+            if b'Etag' not in self.response.fields:
+                self.response.fields[b'Etag'] = self.content_etag()
 
-            if self.response.status_code == 200 and \
-                    b'If-None-Match' in self.request.fields and \
-                    self.request.fields.get(b'If-None-Match') == \
-                    self.response.fields.get(b'Etag'):
+            if self.not_modified():
                 self.response.status_code = 304
-                yield from self.write(self.response.to_bytes())
-                yield from self.write(b'\r\n')
+                yield from self.writelines([self.response.to_bytes(), b'\r\n'])
             else:
-                yield from self.write(self.response.to_bytes())
-                yield from self.write(b'\r\n')
+                parts = [self.response.to_bytes(), b'\r\n']
 
                 if self.request.method != b'HEAD':
-                    yield from self.write(self.buffer.getvalue())
+                    if self.server.fragmented_writes:
+                        parts.append(b''.join(self.buffer))
+                    else:
+                        parts.extend(self.buffer)
+
+                yield from self.writelines(parts)
 
         if not self.closed and (
                 self.request.fields.get(b'connection') == b'close' or
                 self.request.version != b'HTTP/1.1'):
             self.close()
 
+    def not_modified(self):
+        return self.response.status_code == 200 and \
+            b'If-None-Match' in self.request.fields and \
+            self.request.fields.get(b'If-None-Match') == \
+            self.response.fields.get(b'Etag')
+
+    def content_etag(self):
+        '''Return the ETag of the buffered content.
+
+        The ETag is cached under :meth:`etag_cache_key` when
+        :attr:`etag_key` is set, so it should only be set for content that
+        does not change.
+        '''
+        if self.etag_key is None:
+            return self._hash_buffer()
+
+        key = self.etag_cache_key()
+        etag = ETAG_CACHE.get(key)
+
+        if etag is None:
+            if len(ETAG_CACHE) >= ETAG_CACHE_SIZE:
+                ETAG_CACHE.clear()
+
+            etag = ETAG_CACHE[key] = self._hash_buffer()
+
+        return etag
+
+    def etag_cache_key(self):
+        return (self.server.etag_algorithm, self.etag_key)
+
+    def _hash_buffer(self):
+        hash_obj = hashlib.new(self.server.etag_algorithm)
+
+        for data in self.buffer:
+            hash_obj.update(data)
+
+        return hash_obj.hexdigest().encode('ascii')
+
     def close(self):
         self.closed = True
         self.writer.close()
 
     @asyncio.coroutine
     def write(self, data):
-        self.writer.write(data)
-        yield from self.writer.drain()
+        yield from self._send([data])
+
+    @asyncio.coroutine
+    def writelines(self, parts):
+        if self.server.fragmented_writes:
+            for part in parts:
+                yield from self.write(part)
+        else:
+            yield from self._send(parts)
+
+    def _take_pending_head(self, parts):
+        '''Return the parts with the deferred response head in front.'''
+        if self._pending_head:
+            parts = self._pending_head + list(parts)
+            self._pending_head = None
+
+        return parts
+
+    @asyncio.coroutine
+    def _send(self, parts):
+        parts = self._take_pending_head(parts)
+
+        if len(parts) == 1:
+            self.writer.write(parts[0])
+        else:
+            self.writer.writelines(parts)
+
+        transport = self.writer.transport
+
+        if transport.is_closing() or \
+                transport.get_write_buffer_size() > self._high_water:
+            yield from self.writer.drain()
 
     @asyncio.coroutine
     def write_header(self, status_code, reason=b'', headers=None):
@@ -101,30 +178,95 @@ class Handler(object):
             if b'Transfer-encoding' not in self.response.fields:
                 self.response.fields[b'Transfer-Encoding'] = b'chunked'
 
-            yield from self.write(self.response.to_bytes())
-            yield from self.write(b'\r\n')
+            if self.server.fragmented_writes:
+                yield from self.write(self.response.to_bytes())
+                yield from self.write(b'\r\n')
+            else:
+                self._pending_head = [self.response.to_bytes(), b'\r\n']
         else:
-            self.buffer = io.BytesIO()
-            self.buffer_hash = hashlib.sha1()
+            self.buffer = []
+            self.buffer_length = 0
 
     @asyncio.coroutine
     def write_content(self, data):
         if self.streaming:
             yield from self.write_chunk(data)
         else:
-            self.buffer.write(data)
-            self.buffer_hash.update(data)
-            if self.buffer.tell() > 10000:
+            self.buffer.append(memoryview(data))
+            self.buffer_length += len(data)
+
+            if self.buffer_length > self.MAX_BUFFER_SIZE:
+                buffer = self.buffer
+                self.buffer = None
                 self.stream()
                 yield from self.begin_content()
-                yield from self.write_chunk(self.buffer.getvalue())
+                yield from self.write_chunk_parts(buffer)
 
     @asyncio.coroutine
     def write_chunk(self, data):
-        yield from self.write('{:x}'.format(len(data)).encode('ascii'))
-        yield from self.write(b'\r\n')
-        yield from self.write(data)
-        yield from self.write(b'\r\n')
+        yield from self.write_chunk_parts((data,))
+
+    @asyncio.coroutine
+    def write_chunk_parts(self, parts):
+        length = sum(len(data) for data in parts)
+
+        if self.server.fragmented_writes:
+            yield from self.write('{:x}'.format(length).encode('ascii'))
+            yield from self.write(b'\r\n')
+            yield from self.write(b''.join(parts))
+            yield from self.write(b'\r\n')
+        else:
+            lines = ['{:x}\r\n'.format(length).encode('ascii')]
+            lines.extend(parts)
+            lines.append(b'\r\n')
+            yield from self.writelines(lines)
+
+    @asyncio.coroutine
+    def send_content(self, data):
+        '''Send the response head and all of the content in one write.
+
+        The response must not be streamed and nothing may have been written
+        with :meth:`write_content`.
+        '''
+        assert not self.streaming
+        self.content_sent = True
+
+        if self.not_modified():
+            self.response.status_code = 304
+            yield from self.writelines([self.response.to_bytes(), b'\r\n'])
+            return
+
+        self.response.fields[b'Content-Length'] = \
+            str(len(data)).encode('ascii')
+        parts = [self.response.to_bytes(), b'\r\n']
+
+        if self.request.method != b'HEAD':
+            parts.append(data)
+
+        yield from self.writelines(parts)
+
+    @asyncio.coroutine
+    def send_file(self, file, offset=0, count=None):
+        '''Send the response head and then the file with sendfile.
+
+        The response must not be streamed and nothing may have been written
+        with :meth:`write_content`.
+        '''
+        assert not self.streaming
+
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+
+        self.response.fields[b'Content-Length'] = str(count).encode('ascii')
+        self.content_sent = True
+
+        yield from self.writelines([self.response.to_bytes(), b'\r\n'])
+
+        if self.closed or self.request.method == b'HEAD':
+            return
+
+        yield from asyncio.get_event_loop().sendfile(
+            self.writer.transport, file, offset, count)
 
     def stream(self):
         self.streaming = True
@@ -1,33 +1,115 @@
 import re
 import collections.abc
+import email.utils
+import functools
+import time
+
+
+REQUEST_LINE_RE = re.compile(
+    br'(\w+)\s+(\S+)\s+(HTTP/\d+\.\d+)', re.IGNORECASE)
+BLANK_LINE_RE = re.compile(br'[ \t\r\x0b\x0c]*\n')
+HEAD_END_RE = re.compile(br'\n[ \t\r\x0b\x0c]*\n')
+FIELD_LINE_RE = re.compile(br'([ \t][^\n]*)\n|([^:\n]*):([^\n]*)\n|[^\n]*\n')
+
+STATUS_CODES = dict(
+    (code, str(code).encode('ascii')) for code in range(100, 600))
+CACHED_FIELD_NAMES = frozenset([
+    b'accept-ranges',
+    b'content-encoding',
+    b'content-type',
+    b'expires',
+    b'transfer-encoding',
+    b'x-dragon',
+])
+FIELD_LINE_CACHE = {}
+FIELD_LINE_CACHE_SIZE = 1024
+DATE_CACHE = {}
+DATE_CACHE_SIZE = 1024
+MAX_BYTE_RANGES = 16
 
 
 class Fields(collections.abc.MutableMapping):
-    def __init__(self):
-        self.doc = {}
+    '''Header fields kept as raw name and value pairs.
+
+    The original order and casing are kept and a name may repeat. Lookups
+    are case-insensitive through an index that is built on first use.
+    Item access returns the last value of a name, as the dictionary this
+    class replaced did, and item assignment replaces every value of it.
+    '''
+    __slots__ = ('_pairs', '_index')
+
+    def __init__(self, pairs=None):
+        self._pairs = list(pairs) if pairs else []
+        self._index = None
 
     @classmethod
     def normalize_key(cls, key):
-        return key.title()
+        return key.lower()
+
+    def _get_index(self):
+        if self._index is None:
+            index = {}
+
+            for position, (key, value) in enumerate(self._pairs):
+                index.setdefault(key.lower(), []).append(position)
+
+            self._index = index
+
+        return self._index
 
     def __getitem__(self, key):
-        assert isinstance(key, bytes)
-        return self.doc[self.normalize_key(key)]
+        return self._pairs[self._get_index()[key.lower()][-1]][1]
 
     def __setitem__(self, key, value):
-        assert isinstance(key, bytes)
-        assert isinstance(value, bytes)
-        self.doc[self.normalize_key(key)] = value
+        positions = self._get_index().get(key.lower())
+
+        if not positions:
+            self.add(key, value)
+            return
+
+        self._pairs[positions[0]] = (key, value)
+
+        if len(positions) > 1:
+            for position in reversed(positions[1:]):
+                del self._pairs[position]
+
+            self._index = None
 
     def __delitem__(self, key):
-        assert isinstance(key, bytes)
-        del self.doc[self.normalize_key(key)]
+        positions = self._get_index()[key.lower()]
+
+        for position in reversed(positions):
+            del self._pairs[position]
+
+        self._index = None
+
+    def __contains__(self, key):
+        return key.lower() in self._get_index()
 
     def __iter__(self):
-        return iter(self.doc)
+        index = self._get_index()
+
+        for position, (key, value) in enumerate(self._pairs):
+            if index[key.lower()][0] == position:
+                yield key
 
     def __len__(self):
-        return len(self.doc)
+        return len(self._get_index())
+
+    def add(self, key, value):
+        if self._index is not None:
+            self._index.setdefault(key.lower(), []).append(len(self._pairs))
+
+        self._pairs.append((key, value))
+
+    def get_all(self, key):
+        return [
+            self._pairs[position][1]
+            for position in self._get_index().get(key.lower(), ())
+        ]
+
+    def pairs(self):
+        return list(self._pairs)
 
     def parse(self, data):
         self.parse_lines(data.split(b'\n'))
@@ -49,11 +131,36 @@ class Fields(collections.abc.MutableMapping):
             key = key.strip()
             value = value.strip()
 
-            self[key] = value
+            self.add(key, value)
+
+    def lines(self):
+        '''Return the encoded field lines.
+
+        Lines of fields named in :data:`CACHED_FIELD_NAMES` are encoded
+        once and reused. Only fields with a few fixed values are named, so
+        that values that change per response do not fill the cache.
+        '''
+        lines = []
+
+        for pair in self._pairs:
+            line = FIELD_LINE_CACHE.get(pair)
+
+            if line is None:
+                key, value = pair
+                line = key + b':' + value + b'\r\n'
+
+                if key.lower() in CACHED_FIELD_NAMES:
+                    if len(FIELD_LINE_CACHE) >= FIELD_LINE_CACHE_SIZE:
+                        FIELD_LINE_CACHE.clear()
+
+                    FIELD_LINE_CACHE[pair] = line
+
+            lines.append(line)
+
+        return lines
 
     def to_bytes(self):
-        return b'\r\n'.join(
-            key + b':' + value for key, value in self.items()) + b'\r\n'
+        return b''.join(self.lines())
 
 
 class Request(object):
@@ -63,10 +170,10 @@ class Request(object):
         self.version = version
         self.fields = Fields()
         self.payload = None
+        self.line_count = 0
 
     def parse_lines(self, lines):
-        match = re.match(
-            br'(\w+)\s+(\S+)\s+(HTTP/\d+\.\d+)', lines[0], re.IGNORECASE)
+        match = REQUEST_LINE_RE.match(lines[0])
 
         if not match:
             raise ValueError('Failed to parse status line.')
@@ -84,6 +191,74 @@ class Request(object):
         ])
 
 
+class RequestHeadParser(object):
+    '''Incremental parser for a request head at the start of a buffer.
+
+    :meth:`scan` is called each time the buffer grows and resumes where the
+    previous call stopped. Once the blank line is found, :meth:`parse`
+    slices the request line and fields out of the buffer without splitting
+    it into lines.
+    '''
+    def __init__(self):
+        self.length = 0
+        self.end = None
+        self._position = 0
+
+    def scan(self, buffer):
+        '''Return the offset after the head or None if incomplete.'''
+        if self.end is not None:
+            return self.end
+
+        match = BLANK_LINE_RE.match(buffer)
+
+        if match:
+            self.end = match.end()
+            return self.end
+
+        match = HEAD_END_RE.search(buffer, self._position)
+
+        if match:
+            self.length = match.start() + 1
+            self.end = match.end()
+        else:
+            self._position = max(0, buffer.rfind(b'\n'))
+
+        return self.end
+
+    def parse(self, buffer):
+        assert self.end is not None
+        view = memoryview(buffer)
+
+        try:
+            line_end = buffer.find(b'\n', 0, self.length) + 1
+            match = REQUEST_LINE_RE.match(view, 0, line_end)
+
+            if not match:
+                raise ValueError('Failed to parse status line.')
+
+            request = Request(*match.group(1, 2, 3))
+            fields = []
+
+            for match in FIELD_LINE_RE.finditer(view, line_end, self.length):
+                continuation, key, value = match.groups()
+
+                if continuation is not None:
+                    if fields:
+                        key, value = fields[-1]
+                        fields[-1] = (key, value + b' ' + continuation.strip())
+                elif key is not None:
+                    fields.append((key.strip(), value.strip()))
+                else:
+                    raise ValueError('Failed to parse field line.')
+
+            request.fields = Fields(fields)
+            request.line_count = buffer.count(b'\n', 0, self.end)
+        finally:
+            view.release()
+
+        return request
+
+
 class Response(object):
     def __init__(self, version=None, status_code=None, reason=None):
         self.version = version
@@ -106,8 +281,81 @@ class Response(object):
         self.fields.parse_lines(lines[1:])
 
     def to_bytes(self):
-        return b''.join([
-            self.version, b' ',
-            str(self.status_code).encode('ascii'), b' ', self.reason, b'\r\n',
-            self.fields.to_bytes()
-        ])
+        lines = self.fields.lines()
+        lines.insert(
+            0, status_line(self.version, self.status_code, self.reason))
+        return b''.join(lines)
+
+
+@functools.lru_cache(maxsize=256)
+def status_line(version, status_code, reason):
+    code = STATUS_CODES.get(status_code) or str(status_code).encode('ascii')
+    return b''.join([version, b' ', code, b' ', reason, b'\r\n'])
+
+
+def format_date(timestamp=None):
+    '''Return a date for a header field, formatting each second once.'''
+    if timestamp is None:
+        timestamp = time.time()
+
+    second = int(timestamp)
+    date = DATE_CACHE.get(second)
+
+    if date is None:
+        if len(DATE_CACHE) >= DATE_CACHE_SIZE:
+            DATE_CACHE.clear()
+
+        date = DATE_CACHE[second] = \
+            email.utils.formatdate(second).encode('ascii')
+
+    return date
+
+
+def parse_byte_ranges(value, length):
+    '''Return the satisfiable ranges of a Range field value.
+
+    Each range is a ``(first, last)`` pair of byte positions in content of
+    ``length`` bytes. None is returned if the value is not a byte range set
+    of at most :data:`MAX_BYTE_RANGES` ranges and should be ignored.
+    '''
+    unit, sep, range_set = value.partition(b'=')
+
+    if not sep or unit.strip().lower() != b'bytes':
+        return None
+
+    specs = range_set.split(b',')
+
+    if len(specs) > MAX_BYTE_RANGES:
+        return None
+
+    ranges = []
+
+    for spec in specs:
+        first, sep, last = spec.strip().partition(b'-')
+
+        if not sep or (first and not first.isdigit()) or \
+                (last and not last.isdigit()) or not (first or last):
+            return None
+
+        if not first:
+            suffix_length = int(last)
+
+            if suffix_length and length:
+                ranges.append((max(0, length - suffix_length), length - 1))
+
+            continue
+
+        first = int(first)
+
+        if last:
+            last = int(last)
+
+            if last < first:
+                return None
+        else:
+            last = length - 1
+
+        if first < length:
+            ranges.append((first, min(last, length - 1)))
+
+    return ranges
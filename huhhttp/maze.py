@@ -0,0 +1,139 @@
+'''An endless site made up from a hash of the seed and the URL.
+
+Nothing is stored. The same seed and path always give the same page, so a
+crawler can come back to any of the pages it found.
+'''
+import hashlib
+import random
+import re
+import urllib.parse
+
+from huhhttp.post import POSTS
+
+
+WORDS = tuple(sorted(frozenset(
+    word.lower() for word in
+    re.findall(r'[A-Za-z]{3,}', ' '.join(POSTS.values())))))
+HREF_FORMATS = (
+    'HREF={}',
+    'HREF="{}"',
+    "HREF='{}'",
+    'HREF = {} ',
+)
+LINK_FORMATS = (
+    '/maze/{path}{token}/',
+    'maze/{path}{token}/',
+    '/maze/{path}./{token}/',
+    '/maze//{path}{token}//',
+    '/maze/{path}{token}/../{token}/',
+    '/maze/{path}{quoted}/',
+    '/maze/{path}{token}/?ref=smaug',
+    '/maze/{path}{token}/#lair',
+    'MAZE/{path}{token}/',
+    'http://{token}.lair./maze/{path}',
+    '//[::ffff:7f00:1]:0/maze/{path}{token}/',
+)
+
+
+def hash_int(*values):
+    digest = hashlib.sha1(repr(values).encode('utf8', 'replace')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class MazePage(object):
+    '''A page of the maze at a path below ``/maze/``.
+
+    The path is split into segments with dot segments resolved and
+    percent escapes decoded, so different spellings of a URL give the same
+    page. Every subtree has its own maximum depth and each page links to
+    its children, its parent and new subtrees.
+    '''
+    MIN_DEPTH = 3
+    MAX_DEPTH = 12
+    MAX_FAN_OUT = 12
+
+    def __init__(self, seed, path):
+        self.segments = self.split_path(path)
+        self.depth = len(self.segments)
+        self._rand = random.Random(hash_int(seed, self.segments))
+
+        if self.segments:
+            self.max_depth = self.MIN_DEPTH + hash_int(
+                seed, self.segments[0]) % (self.MAX_DEPTH - self.MIN_DEPTH)
+        else:
+            self.max_depth = self.MAX_DEPTH
+
+        self.title = self._words(3, 9).upper()
+        self.body = self._render_body()
+
+    @classmethod
+    def split_path(cls, path):
+        segments = []
+
+        for segment in path.split('/'):
+            segment = urllib.parse.unquote(segment, errors='replace')
+
+            if segment == '..':
+                if segments:
+                    segments.pop()
+            elif segment and segment != '.':
+                segments.append(segment)
+
+        return tuple(segments)
+
+    def _words(self, min_count, max_count):
+        return ' '.join(self._rand.choices(
+            WORDS, k=self._rand.randint(min_count, max_count)))
+
+    def _token(self):
+        return '{}-{:x}'.format(
+            self._rand.choice(WORDS), self._rand.getrandbits(24))
+
+    def _link(self, path, token):
+        link_format = self._rand.choice(LINK_FORMATS)
+
+        if '{quoted}' in link_format:
+            quoted = ''.join('%{:02X}'.format(char)
+                             for char in token.encode('utf8'))
+        else:
+            quoted = None
+
+        url = link_format.format(path=path, token=token, quoted=quoted)
+
+        return '<A {}>{}</A>'.format(
+            self._rand.choice(HREF_FORMATS).format(url),
+            self._words(1, 6).title())
+
+    @classmethod
+    def _quote_path(cls, segments):
+        return ''.join(
+            urllib.parse.quote(segment) + '/' for segment in segments)
+
+    def _render_body(self):
+        content = ['<H1>{}</H1>'.format(self.title)]
+
+        for dummy in range(self._rand.randint(1, 6)):
+            content.append('<P>{}.'.format(self._words(10, 80).capitalize()))
+
+        links = []
+
+        if self.depth < self.max_depth:
+            path = self._quote_path(self.segments)
+
+            for dummy in range(self._rand.randint(0, self.MAX_FAN_OUT)):
+                links.append(self._link(path, self._token()))
+
+        if self.depth > 1:
+            links.append(self._link(
+                self._quote_path(self.segments[:-2]),
+                urllib.parse.quote(self.segments[-2])))
+        elif self.segments:
+            links.append(self._link('', ''))
+
+        for dummy in range(self._rand.randint(1, 3)):
+            links.append(self._link('', self._token()))
+
+        self._rand.shuffle(links)
+        content.append('<BR>\n'.join(links))
+
+        return '\n'.join(content)
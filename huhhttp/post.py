@@ -1,3 +1,6 @@
+import re
+import urllib.parse
+
 
 POSTS = {
     (1997, 2, 9): '''
@@ -435,4 +438,81 @@ POSTS = {
     '''
 }
 
-POST_KEYS = tuple(sorted(POSTS.keys()))
+
+def post_content_to_url_slug(text, encoding='utf-8'):
+    text = re.sub(r'([\s<>"\']+)', '-', text[:60].strip().lower()).strip('-')
+    return urllib.parse.quote(text, encoding=encoding)
+
+
+class PostIndex(object):
+    '''Navigation and listings of posts, computed once.
+
+    Posts are keyed by ``(year, month, day)``. The index holds the URL of
+    each post, its neighbours and the HTML list items of the recent and
+    all posts listings.
+
+    It is the in-memory corpus. Other corpora, such as
+    :class:`huhhttp.corpus.SqliteCorpus`, provide the same methods.
+    '''
+    RECENT_COUNT = 3
+    PAGE_SIZE = 100
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.keys = tuple(sorted(posts))
+        self._positions = dict(
+            (key, index) for index, key in enumerate(self.keys))
+        self._urls = {}
+        items = []
+
+        for key in self.keys:
+            year, month, day = key
+            post = posts[key]
+            self._urls[key] = 'wirdpress/post/{}/{}/{}/{}'.format(
+                year, month, day, post_content_to_url_slug(post))
+            items.append('<LI><A HREF="{}">{}</A>'.format(
+                self._urls[key], post[:60]))
+
+        self.recent_posts = ''.join(items[:self.RECENT_COUNT])
+        self._pages = [
+            ''.join(items[index:index + self.PAGE_SIZE])
+            for index in range(0, len(items), self.PAGE_SIZE)
+        ] or ['']
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def listing(self, page):
+        '''Return the list items of a page of all posts, counting from 1.'''
+        if 1 <= page <= len(self._pages):
+            return self._pages[page - 1]
+
+    def get(self, key):
+        return self.posts.get(key)
+
+    def url(self, key):
+        return self._urls[key]
+
+    def prev_key(self, key):
+        '''Return the key of the previous post.
+
+        The first post is its own previous post.
+        '''
+        index = self._positions.get(key)
+
+        if index is not None:
+            return self.keys[max(0, index - 1)]
+
+    def next_key(self, key):
+        index = self._positions.get(key)
+
+        if index is not None and index + 1 < len(self.keys):
+            return self.keys[index + 1]
+
+
+POST_INDEX = PostIndex(POSTS)
+POST_KEYS = POST_INDEX.keys
@@ -0,0 +1,219 @@
+'''Server core built on asyncio buffered protocols.
+
+It is an alternative to :func:`asyncio.start_server`. Received data goes
+into a preallocated buffer for each connection, and the connection
+callback gets reader and writer objects with the stream methods that
+:class:`huhhttp.server.Server` and the handlers use.
+'''
+import asyncio
+import functools
+
+
+BaseProtocol = getattr(asyncio, 'BufferedProtocol', asyncio.Protocol)
+
+
+class BufferedServerProtocol(BaseProtocol):
+    MIN_READ_SIZE = 4096
+
+    def __init__(self, callback, buffer_size=65536):
+        self._callback = callback
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._eof = False
+        self._exception = None
+        self._read_paused = False
+        self._write_paused = False
+        self._read_waiter = None
+        self._drain_waiter = None
+        self.transport = None
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.task = asyncio.get_event_loop().create_task(
+            self._callback(ProtocolReader(self), ProtocolWriter(self)))
+
+    def connection_lost(self, exc):
+        self._eof = True
+
+        if exc is None:
+            exc = ConnectionResetError('Connection lost')
+
+        self._exception = exc
+        self._wake_reader()
+
+        if self._drain_waiter and not self._drain_waiter.done():
+            self._drain_waiter.set_exception(exc)
+
+    def get_buffer(self, sizehint=-1):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._start and \
+                len(self._buffer) - self._end < self.MIN_READ_SIZE:
+            length = self._end - self._start
+            self._buffer[:length] = self._view[self._start:self._end]
+            self._start = 0
+            self._end = length
+
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+
+        if self._end == len(self._buffer) and self._start == 0:
+            self.transport.pause_reading()
+            self._read_paused = True
+
+        self._wake_reader()
+
+    def eof_received(self):
+        self._eof = True
+        self._wake_reader()
+        return True
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+
+        if self._drain_waiter and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def _wake_reader(self):
+        if self._read_waiter and not self._read_waiter.done():
+            self._read_waiter.set_result(None)
+
+    @asyncio.coroutine
+    def wait_for_data(self):
+        while self._start == self._end and not self._eof:
+            self._read_waiter = asyncio.Future()
+            try:
+                yield from self._read_waiter
+            finally:
+                self._read_waiter = None
+
+    def consume(self, length):
+        if length < 0:
+            length = self._end - self._start
+        else:
+            length = min(length, self._end - self._start)
+
+        data = bytes(self._view[self._start:self._start + length])
+        self._start += length
+
+        if self._read_paused:
+            self._read_paused = False
+            self.transport.resume_reading()
+
+        return data
+
+    def find(self, sub):
+        index = self._buffer.find(sub, self._start, self._end)
+
+        if index >= 0:
+            return index - self._start
+
+        return index
+
+    def at_eof(self):
+        return self._eof and self._start == self._end
+
+    @property
+    def full(self):
+        return self._start == 0 and self._end == len(self._buffer)
+
+    @asyncio.coroutine
+    def drain(self):
+        if self._exception:
+            raise self._exception
+
+        if self.transport.is_closing():
+            yield from asyncio.sleep(0)
+
+        if self._write_paused:
+            self._drain_waiter = asyncio.Future()
+            try:
+                yield from self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+
+class ProtocolReader(object):
+    def __init__(self, protocol):
+        self._protocol = protocol
+
+    @asyncio.coroutine
+    def read(self, length=-1):
+        if length < 0:
+            parts = []
+
+            while True:
+                yield from self._protocol.wait_for_data()
+                data = self._protocol.consume(-1)
+
+                if not data:
+                    return b''.join(parts)
+
+                parts.append(data)
+
+        yield from self._protocol.wait_for_data()
+        return self._protocol.consume(length)
+
+    @asyncio.coroutine
+    def readline(self):
+        while True:
+            index = self._protocol.find(b'\n')
+
+            if index >= 0:
+                return self._protocol.consume(index + 1)
+            elif self._protocol.full or self._protocol.at_eof():
+                return self._protocol.consume(-1)
+
+            yield from self._protocol.wait_for_data()
+
+    def at_eof(self):
+        return self._protocol.at_eof()
+
+
+class ProtocolWriter(object):
+    def __init__(self, protocol):
+        self._protocol = protocol
+
+    @property
+    def transport(self):
+        return self._protocol.transport
+
+    def write(self, data):
+        self._protocol.transport.write(data)
+
+    def writelines(self, data):
+        self._protocol.transport.writelines(data)
+
+    def write_eof(self):
+        return self._protocol.transport.write_eof()
+
+    def can_write_eof(self):
+        return self._protocol.transport.can_write_eof()
+
+    def close(self):
+        self._protocol.transport.close()
+
+    def get_extra_info(self, name, default=None):
+        return self._protocol.transport.get_extra_info(name, default)
+
+    @asyncio.coroutine
+    def drain(self):
+        yield from self._protocol.drain()
+
+
+@asyncio.coroutine
+def start_buffered_server(client_connected_cb, host=None, port=None,
+                          buffer_size=65536, **kwargs):
+    '''Start a server like :func:`asyncio.start_server` does.'''
+    factory = functools.partial(
+        BufferedServerProtocol, client_connected_cb, buffer_size=buffer_size)
+    return (yield from asyncio.get_event_loop().create_server(
+        factory, host, port, **kwargs))
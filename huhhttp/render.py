@@ -0,0 +1,184 @@
+'''Templates with their constant text encoded once per codec.'''
+import codecs
+import collections
+import string
+import sys
+
+from huhhttp.template import SITE_TEMPLATE, BANNER_NAV
+
+
+if sys.byteorder == 'little':
+    BOM_CODECS = {
+        'utf-8-sig': 'utf-8',
+        'utf-16': 'utf-16-le',
+        'utf-32': 'utf-32-le',
+    }
+else:
+    BOM_CODECS = {
+        'utf-8-sig': 'utf-8',
+        'utf-16': 'utf-16-be',
+        'utf-32': 'utf-32-be',
+    }
+
+
+def is_stateful(codec_name):
+    '''Return whether encoding text in pieces gives other bytes than whole.
+
+    These codecs carry shift states or open base64 runs across characters.
+    '''
+    return codec_name in ('utf-7', 'hz') or codec_name.startswith('iso2022')
+
+
+class Template(object):
+    '''A format string split at its replacement fields.
+
+    Fields given as ``constants`` are folded into the literal text. For
+    each codec the literal text is encoded once, so that rendering only
+    encodes the field values and joins bytes. Codecs with a byte order
+    mark put it in front once and encode the pieces with their twin
+    without one. Stateful codecs encode the whole formatted text.
+    '''
+    def __init__(self, text, **constants):
+        self.text = text
+        self.constants = constants
+        self._literals = []
+        self._fields = []
+        self._encoded = {}
+        literal = []
+
+        for literal_text, field_name, format_spec, conversion in \
+                string.Formatter().parse(text):
+            literal.append(literal_text)
+
+            if field_name is None:
+                continue
+
+            assert not format_spec and not conversion, field_name
+
+            if field_name in constants:
+                literal.append(constants[field_name])
+            else:
+                self._literals.append(''.join(literal))
+                self._fields.append(field_name)
+                literal = []
+
+        self._literals.append(''.join(literal))
+
+    def format(self, **values):
+        return self.text.format(**dict(self.constants, **values))
+
+    def render(self, encoding, errors='replace', **values):
+        encoded = self._encoded.get((encoding, errors))
+
+        if encoded is None:
+            encoded = self._encoded[(encoding, errors)] = \
+                self._encode_literals(encoding, errors)
+
+        if encoded is False:
+            return self.format(**values).encode(encoding, errors)
+
+        bom, piece_encoding, literals = encoded
+        parts = [bom]
+
+        for literal, field_name in zip(literals, self._fields):
+            parts.append(literal)
+            parts.append(values[field_name].encode(piece_encoding, errors))
+
+        parts.append(literals[-1])
+
+        return b''.join(parts)
+
+    def _encode_literals(self, encoding, errors):
+        codec_name = codecs.lookup(encoding).name
+
+        if is_stateful(codec_name):
+            return False
+
+        if codec_name in BOM_CODECS:
+            piece_encoding = BOM_CODECS[codec_name]
+            bom = ''.encode(encoding)
+        else:
+            piece_encoding = encoding
+            bom = b''
+
+        literals = [
+            literal.encode(piece_encoding, errors)
+            for literal in self._literals
+        ]
+
+        return bom, piece_encoding, literals
+
+
+class RenderCache(object):
+    '''Least recently used cache of rendered response bodies.
+
+    A body is kept as the list of pieces that were written, after
+    compression. Keys start with the handler class so that
+    :meth:`invalidate` can drop the bodies of one handler. A body rendered
+    before an invalidation of its handler is not stored. Lookups and
+    changes are counted in :attr:`stats`.
+    '''
+    def __init__(self, max_size=16 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.stats = collections.Counter()
+        self._bodies = collections.OrderedDict()
+        self._versions = collections.Counter()
+
+    def version(self, handler_class):
+        return self._versions[handler_class]
+
+    def get(self, key):
+        pieces = self._bodies.get(key)
+
+        if pieces is None:
+            self.stats['miss'] += 1
+        else:
+            self.stats['hit'] += 1
+            self._bodies.move_to_end(key)
+
+        return pieces
+
+    def store(self, key, pieces, version=0):
+        if version != self._versions[key[0]]:
+            return
+
+        pieces = tuple(bytes(data) for data in pieces)
+        size = sum(len(data) for data in pieces)
+
+        if size > self.max_size:
+            return
+
+        self._remove(key)
+        self._bodies[key] = pieces
+        self.size += size
+        self.stats['store'] += 1
+
+        while self.size > self.max_size:
+            self._remove(next(iter(self._bodies)))
+
+    def invalidate(self, handler_class):
+        self._versions[handler_class] += 1
+
+        for key in [key for key in self._bodies if key[0] is handler_class]:
+            self._remove(key)
+            self.stats['invalidate'] += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.stats['hit'] + self.stats['miss']
+
+        if lookups:
+            return self.stats['hit'] / lookups
+
+        return 0.0
+
+    def _remove(self, key):
+        pieces = self._bodies.pop(key, None)
+
+        if pieces is not None:
+            self.size -= sum(len(data) for data in pieces)
+
+
+SITE_PAGE = Template(SITE_TEMPLATE, banner=BANNER_NAV)
+RENDER_CACHE = RenderCache()
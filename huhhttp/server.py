@@ -2,12 +2,14 @@ import io
 import re
 import urllib.parse
 
-from huhhttp.header import Request
+from huhhttp.header import RequestHeadParser
 import asyncio
 import logging
 
 _logger = logging.getLogger(__name__)
 
+PATH_RE = re.compile(br'[^?#]*')
+
 
 class ProtocolError(ValueError):
     pass
@@ -17,63 +19,230 @@ class CloseConnection(ValueError):
     pass
 
 
+class Router(object):
+    '''Maps request paths to handler classes.
+
+    Patterns are put into buckets by the first path segment of their
+    literal prefix. Each bucket, together with the patterns that have no
+    such segment, is compiled into one alternation that keeps the original
+    order. The winning pattern is matched again on its own so that the
+    handler gets the same groups as before.
+    '''
+    def __init__(self, handlers):
+        self._patterns = [
+            (re.compile(pattern), handler_class)
+            for pattern, handler_class in handlers
+        ]
+        buckets = {}
+        generic = []
+
+        for index, (pattern, handler_class) in enumerate(handlers):
+            key = self.bucket_key(literal_prefix(pattern))
+
+            if key:
+                buckets.setdefault(key, []).append(index)
+            else:
+                generic.append(index)
+
+        self._routes = dict(
+            (key, self._compile(sorted(indexes + generic)))
+            for key, indexes in buckets.items()
+        )
+        self._generic_route = self._compile(generic)
+
+    @classmethod
+    def bucket_key(cls, path):
+        index = path.find(b'/', 1)
+
+        if index > 0:
+            return path[:index + 1]
+
+    def _compile(self, indexes):
+        group_map = {}
+        parts = []
+        group_num = 1
+
+        for index in indexes:
+            pattern = self._patterns[index][0]
+            group_map[group_num] = index
+            parts.append(b'(' + pattern.pattern + b')')
+            group_num += pattern.groups + 1
+
+        try:
+            return re.compile(b'|'.join(parts)), group_map
+        except re.error:
+            _logger.debug('Patterns not combinable', exc_info=True)
+            return None, indexes
+
+    def match(self, path):
+        '''Return the handler class and match object or (None, None).'''
+        combined, group_map = self._routes.get(
+            self.bucket_key(path), self._generic_route)
+
+        if combined:
+            match = combined.fullmatch(path)
+
+            if not match:
+                return None, None
+
+            indexes = (group_map[match.lastindex],)
+        else:
+            indexes = group_map
+
+        for index in indexes:
+            pattern, handler_class = self._patterns[index]
+            match = pattern.fullmatch(path)
+
+            if match:
+                return handler_class, match
+
+        return None, None
+
+
 class Server(object):
-    def __init__(self, handlers=None):
+    def __init__(self, handlers=None, max_pipeline_depth=8, admission=None,
+                 write_high_water=None, write_low_water=None,
+                 fragmented_writes=False, etag_algorithm='sha1'):
         self.handlers = handlers or []
+        self.max_pipeline_depth = max_pipeline_depth
+        self.admission = admission
+        self.write_high_water = write_high_water
+        self.write_low_water = write_low_water
+        self.fragmented_writes = fragmented_writes
+        self.etag_algorithm = etag_algorithm
+        self.router = Router(self.handlers)
+        self.connections = set()
+        self.retired = False
+        self.retire_callback = None
 
     def __call__(self, reader, writer):
-        while True:
-            try:
-                request = yield from self._process_request(reader, writer)
-                yield from self._dispatch(reader, writer, request)
-            except ProtocolError as error:
-                _logger.info('Client error %s', error)
-                writer.write(b'HTTP/1.1 400 ')
-                writer.write(error.args[0].encode('ascii'))
-                writer.write(b'\r\n\r\n')
-                writer.write(error.args[0].encode('ascii'))
-                writer.close()
-                return
-            except CloseConnection:
-                writer.close()
-                return
-            except ConnectionError:
-                writer.close()
-                return
-            except Exception:
-                _logger.exception('Server error.')
-                writer.close()
-                return
+        if self.admission and \
+                not (yield from self.admission.admit('connection', writer)):
+            return
+
+        self.connections.add(writer)
+        try:
+            if self.write_high_water is not None or \
+                    self.write_low_water is not None:
+                writer.transport.set_write_buffer_limits(
+                    high=self.write_high_water, low=self.write_low_water)
+
+            yield from self._handle_connection(reader, writer)
+        except Exception:
+            _logger.exception('Server error.')
+            writer.close()
+        finally:
+            self.connections.discard(writer)
+
+            if self.admission:
+                self.admission.release('connection')
+
+    def retire(self):
+        if not self.retired:
+            self.retired = True
+
+            if self.retire_callback:
+                self.retire_callback(self)
+
+    def abort(self):
+        _logger.debug('Aborting %d connections', len(self.connections))
+        for writer in tuple(self.connections):
+            writer.close()
 
     @asyncio.coroutine
-    def _process_request(self, reader, writer):
-        lines = []
-        bytes_read = 0
+    def _handle_connection(self, reader, writer):
+        queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.max_pipeline_depth)
+        read_task = asyncio.get_event_loop().create_task(
+            self._read_requests(reader, writer, queue, slots))
 
-        while True:
-            line = yield from reader.readline()
-            _logger.debug('Got line %s', line)
+        try:
+            while True:
+                request = yield from queue.get()
 
-            if line[-1:] != b'\n':
-                raise CloseConnection()
+                if isinstance(request, Exception):
+                    raise request
 
-            if not line.strip():
-                break
+                if self.admission:
+                    admitted = yield from self.admission.admit(
+                        'handler', writer)
 
-            lines.append(line)
+                    if not admitted:
+                        return
 
-            bytes_read += len(line)
+                try:
+                    yield from self._dispatch(reader, writer, request)
+                finally:
+                    if self.admission:
+                        self.admission.release('handler')
 
-            if bytes_read > 4096:
+                slots.release()
+
+                if self.retired or writer.transport.is_closing():
+                    writer.close()
+                    return
+        except ProtocolError as error:
+            _logger.info('Client error %s', error)
+            writer.write(b'HTTP/1.1 400 ')
+            writer.write(error.args[0].encode('ascii'))
+            writer.write(b'\r\n\r\n')
+            writer.write(error.args[0].encode('ascii'))
+            writer.close()
+        except CloseConnection:
+            writer.close()
+        except ConnectionError:
+            writer.close()
+        except Exception:
+            _logger.exception('Server error.')
+            writer.close()
+        finally:
+            read_task.cancel()
+
+    @asyncio.coroutine
+    def _read_requests(self, reader, writer, queue, slots):
+        '''Parse pipelined requests ahead of the responses.
+
+        At most ``max_pipeline_depth`` requests are parsed and not yet
+        answered. A parse error is queued behind the requests before it so
+        that the responses stay in order.
+        '''
+        buffer = bytearray()
+
+        try:
+            while True:
+                yield from slots.acquire()
+                request = yield from self._process_request(
+                    reader, writer, buffer)
+                queue.put_nowait(request)
+        except Exception as error:
+            queue.put_nowait(error)
+
+    @asyncio.coroutine
+    def _process_request(self, reader, writer, buffer):
+        parser = RequestHeadParser()
+
+        while parser.scan(buffer) is None:
+            if len(buffer) > 4096:
                 raise ProtocolError('Header too long')
 
-        if not lines:
+            data = yield from reader.read(4096)
+            _logger.debug('Got data len=%s', len(data))
+
+            if not data:
+                raise CloseConnection()
+
+            buffer.extend(data)
+
+        if parser.length > 4096:
+            raise ProtocolError('Header too long')
+
+        if not parser.length:
             raise ProtocolError('No header.')
 
         _logger.debug('Parse request.')
 
-        request = Request()
-        request.parse_lines(lines)
+        request = parser.parse(buffer)
+        del buffer[:parser.end]
 
         if b'content-length' in request.fields:
             try:
@@ -86,12 +255,17 @@ class Server(object):
                 raise ProtocolError('Content length too big')
 
             _logger.debug('Reading payload len=%s', length)
-            bytes_left = length
-            request.payload = io.BytesIO()
+            request.payload = io.BytesIO(buffer[:length])
+            request.payload.seek(0, io.SEEK_END)
+            bytes_left = length - request.payload.tell()
+            del buffer[:length]
 
             while bytes_left > 0:
                 data = yield from reader.read(min(bytes_left, 4096))
 
+                if not data:
+                    raise CloseConnection()
+
                 request.payload.write(data)
                 bytes_left -= len(data)
 
@@ -101,21 +275,122 @@ class Server(object):
 
     @asyncio.coroutine
     def _dispatch(self, reader, writer, request):
-        parse_result = urllib.parse.urlsplit(request.uri)
-
-        path = parse_result.path
+        if request.uri[0:1] == b'/' and request.uri[1:2] != b'/':
+            path = PATH_RE.match(request.uri).group()
+        else:
+            path = urllib.parse.urlsplit(request.uri).path
 
         if path[0:1] != b'/':
             raise ProtocolError('Bad path')
 
-        for pattern, handler_class in self.handlers:
-            match = re.fullmatch(pattern, path)
-            if match:
-                handler = handler_class(self, reader, writer, request, match)
-                return (yield from handler())
+        handler_class, match = self.router.match(path)
+
+        if handler_class:
+            handler = handler_class(self, reader, writer, request, match)
+            return (yield from handler())
         else:
             _logger.debug('Handler not found for path %s', path)
             writer.write(b'HTTP/1.1 404 Not found\r\n')
             writer.write(b'Content-Length: 3\r\n')
             writer.write(b'\r\n')
             writer.write(b'404')
+
+
+class GenerationServer(object):
+    '''Hands new connections to the current generation of servers.
+
+    When the current server retires, a fresh one is made by ``factory``
+    while the listening socket stays open. The retired server keeps its
+    connections until they finish or ``drain_timeout`` seconds pass.
+    '''
+    def __init__(self, factory, drain_timeout=30):
+        self._factory = factory
+        self.drain_timeout = drain_timeout
+        self.generation = 0
+        self.current = self._new_generation()
+
+    def __call__(self, reader, writer):
+        return self.current(reader, writer)
+
+    def _new_generation(self):
+        server = self._factory()
+        server.retire_callback = self._swap
+        self.generation += 1
+        return server
+
+    def _swap(self, old_server):
+        if old_server is not self.current:
+            return
+
+        self.current = self._new_generation()
+
+        _logger.info('Generation %d started. Draining %d connections.',
+                     self.generation, len(old_server.connections))
+
+        if old_server.connections:
+            asyncio.get_event_loop().call_later(
+                self.drain_timeout, old_server.abort)
+
+
+def literal_prefix(pattern):
+    '''Return the bytes every match of a regular expression starts with.'''
+    if has_top_level_alternation(pattern):
+        return b''
+
+    prefix = bytearray()
+    index = 0
+
+    while index < len(pattern):
+        char = pattern[index:index + 1]
+
+        if char == b'\\':
+            literal = pattern[index + 1:index + 2]
+
+            if not literal or literal.isalnum():
+                break
+
+            length = 2
+        elif char in b'.^$*+?{}[]|()':
+            break
+        else:
+            literal = char
+            length = 1
+
+        following = pattern[index + length:index + length + 1]
+
+        if following and following in b'*?{':
+            break
+
+        prefix.extend(literal)
+        index += length
+
+        if following == b'+':
+            break
+
+    return bytes(prefix)
+
+
+def has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    index = 0
+
+    while index < len(pattern):
+        char = pattern[index:index + 1]
+
+        if char == b'\\':
+            index += 1
+        elif in_class:
+            in_class = char != b']'
+        elif char == b'[':
+            in_class = True
+        elif char == b'(':
+            depth += 1
+        elif char == b')':
+            depth -= 1
+        elif char == b'|' and not depth:
+            return True
+
+        index += 1
+
+    return False
@@ -1,116 +1,75 @@
+import array
 import asyncio
 import calendar
 import collections
 import email.utils
+import functools
 import gzip
 import html
+import itertools
 import logging
+import mmap
 import os.path
-import re
-import socket
-import struct
 import time
 import urllib.parse
+import zlib
 
+from huhhttp.admission import CompressionControl
+from huhhttp.assetcache import AssetCache
+from huhhttp.bomb import ENCODINGS, MAX_DEPTH, MAX_RATIO, make_bomb
 from huhhttp.compress import GzipCompressor, DeflateCompressor, \
-    RawDeflateCompressor
-from huhhttp.fuzz import ConnectionAction, CompressType
+    RawDeflateCompressor, compress_data
+from huhhttp.fuzz import ConnectionAction, CompressType, RangeFault
 from huhhttp.handler import Handler, StopProcessing
-from huhhttp.post import POSTS, POST_KEYS
+from huhhttp.header import parse_byte_ranges
+from huhhttp.maze import MazePage
+from huhhttp.post import POST_INDEX
+from huhhttp.render import SITE_PAGE, RENDER_CACHE
 from huhhttp.server import Server
-from huhhttp.template import SITE_TEMPLATE, BANNER_NAV, INDEX_CONTENT, \
-    SIMPLE_404, CALENDAR_TEMPLATE, WEB_RING_REDIRECT, WEB_RING_CONTENT, \
-    GUESTBOOK_INTRO, GUESTBOOK_BODY, GUESTBOOK_ENTRY, POST_ENTRY, RSS_TEMPLATE, \
-    ATOM_TEMPLATE, CSI, DEFAULT_REASON, OSC
+from huhhttp.template import INDEX_CONTENT, SIMPLE_404, CALENDAR_TEMPLATE, \
+    WEB_RING_REDIRECT, WEB_RING_CONTENT, GUESTBOOK_INTRO, GUESTBOOK_BODY, \
+    GUESTBOOK_ENTRY, POST_ENTRY, RSS_TEMPLATE, ATOM_TEMPLATE, CSI, \
+    DEFAULT_REASON, OSC
 
 
 _logger = logging.getLogger(__name__)
 
 
-class FuzzReaderWrapper(object):
-    def __init__(self, reader, writer, fuzzer):
-        self._reader = reader
-        self._writer = writer
-        self._fuzzer = fuzzer
-        self._fuzz = None
-        self._ready_to_fuzz = False
+COMPRESSORS = {
+    CompressType.gzip: GzipCompressor,
+    CompressType.gzip_broken: GzipCompressor,
+    CompressType.deflate: DeflateCompressor,
+    CompressType.raw_default: RawDeflateCompressor,
+}
 
-    def __getattr__(self, key):
-        return getattr(self._reader, key)
-
-    @property
-    def fuzz_session(self):
-        return self._fuzz
-
-    @asyncio.coroutine
-    def read(self, length=-1):
-        if not (yield from self._fuzz_read()):
-            return (yield from self._reader.read(length))
-        else:
-            return b''
-
-    @asyncio.coroutine
-    def readline(self):
-        if not (yield from self._fuzz_read()):
-            return (yield from self._reader.readline())
-        else:
-            return b''
-
-    @asyncio.coroutine
-    def _fuzz_read(self):
-        if not self._fuzz and self._ready_to_fuzz:
-            self._new_fuzz_session()
-        elif not self._fuzz:
-            self._ready_to_fuzz = True
-            return
-
-        hang_time = self._fuzz.hang_time()
-        connection_action = self._fuzz.connection_action()
-
-        if hang_time:
-            yield from asyncio.sleep(hang_time)
-
-        if connection_action == ConnectionAction.close:
-            self.close()
-            return True
-        elif connection_action == ConnectionAction.reset:
-            self.reset_connection()
-            return True
-
-    def close(self):
-        self._writer.close()
-
-    def reset_connection(self):
-        # http://stackoverflow.com/a/6440364/1524507
-        sock = self._writer.get_extra_info('socket')
-        l_onoff = 1
-        l_linger = 0
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
-                        struct.pack('ii', l_onoff, l_linger))
-        sock.close()
-        self._writer.close()
-
-    def _new_fuzz_session(self):
-        assert not self._fuzz
-        fuzz_session = self._fuzzer.session()
-        _logger.info('Fuzz session: counter=%d threshold=%.04f',
-                     self._fuzzer.counter, fuzz_session.threshold)
-        self._fuzz = fuzz_session
+ASSET_CACHE = AssetCache()
 
 
 class SiteServer(Server):
-    def __init__(self, fuzzer, restart_interval=10000):
-        super().__init__(HANDLERS)
+    def __init__(self, fuzzer, restart_interval=10000, corpus=None,
+                 site_seed=None, dquery_block_size=1000, compression=None,
+                 compress_flush_mode=zlib.Z_NO_FLUSH, asset_cache=None,
+                 **kwargs):
+        super().__init__(HANDLERS, **kwargs)
         self.fuzzer = fuzzer
+        self.compression = compression if compression is not None \
+            else CompressionControl()
+        self.compress_flush_mode = compress_flush_mode
+        self.asset_cache = asset_cache if asset_cache is not None \
+            else ASSET_CACHE
+        self.dquery_block_size = dquery_block_size
+        self.site_seed = site_seed if site_seed is not None else fuzzer.seed
         self.restart_interval = restart_interval
-        self.asyncio_server = None
+        self.corpus = corpus if corpus is not None else POST_INDEX
+        self.request_count = 0
 
     @asyncio.coroutine
-    def _process_request(self, reader, writer):
-        wrapper = FuzzReaderWrapper(reader, writer, self.fuzzer)
-        request = yield from super()._process_request(wrapper, writer)
+    def _process_request(self, reader, writer, buffer):
+        request = yield from super()._process_request(reader, writer, buffer)
+        request.fuzz_session = self.fuzzer.session()
+        _logger.info('Fuzz session: counter=%d threshold=%.04f',
+                     self.fuzzer.counter, request.fuzz_session.threshold)
 
-        request.fuzz_session = wrapper.fuzz_session
         return request
 
 
@@ -118,14 +77,15 @@ class FuzzHandler(Handler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        if self.server.fuzzer.counter and \
-                self.server.fuzzer.counter % self.server.restart_interval == 0:
-            if self.server.asyncio_server:
-                _logger.info('Server close')
-                self.server.fuzzer.counter += 1
-                self.server.asyncio_server.close()
-                asyncio.get_event_loop().stop()
-                raise StopProcessing()
+        self.server.request_count += 1
+
+        if self.server.restart_interval and not self.server.retired and \
+                self.server.request_count >= self.server.restart_interval:
+            _logger.info('Server retire. Render cache %s, hit rate %.2f, '
+                         'compression %s',
+                         dict(RENDER_CACHE.stats), RENDER_CACHE.hit_rate,
+                         dict(self.server.compression.stats))
+            self.server.retire()
 
         _logger.info('Request: %s %s',
                      '{0[0]}:{0[1]}'.format(
@@ -139,16 +99,22 @@ class FuzzHandler(Handler):
         self._compress_type = self._fuzz.compress_type(
             requested=accept_encoding.decode('ascii', 'replace'))
 
-        if self._compress_type in (CompressType.gzip,
-                                   CompressType.gzip_broken):
-            self._compressor = GzipCompressor()
-        elif self._compress_type == CompressType.deflate:
-            self._compressor = DeflateCompressor()
-        elif self._compress_type == CompressType.raw_default:
-            self._compressor = RawDeflateCompressor()
+        compressor_class = COMPRESSORS.get(self._compress_type)
+
+        if compressor_class:
+            self._compressor = compressor_class(
+                level=self.server.compression.level(),
+                flush_mode=self.server.compress_flush_mode)
         else:
             self._compressor = None
 
+    @asyncio.coroutine
+    def prepare(self):
+        if not (yield from self._fuzz_read()):
+            raise StopProcessing()
+
+        yield from super().prepare()
+
     @asyncio.coroutine
     def begin_content(self):
         if self._compress_type and self.response and \
@@ -166,25 +132,83 @@ class FuzzHandler(Handler):
     @asyncio.coroutine
     def write_content(self, data):
         if self._compressor:
-            new_data = self._compressor.write(data)
+            new_data = yield from self.server.compression.run(
+                len(data), self._compressor.write, data)
             if new_data:
-                yield from super().write_content(new_data)
+                yield from self.write_encoded(new_data)
         else:
-            yield from super().write_content(data)
+            yield from self.write_encoded(data)
+
+    @asyncio.coroutine
+    def write_encoded(self, data):
+        '''Write content that is already compressed.'''
+        yield from super().write_content(data)
+
+    def etag_cache_key(self):
+        key = super().etag_cache_key() + (self._compress_type,)
+
+        if self._compressor:
+            key += (self._compressor.level, self._compressor.flush_mode)
+
+        return key
+
+    def break_gzip(self, data):
+        return data[:-4] + b'\xde\xad\xbe\xef'
 
     @asyncio.coroutine
     def finish(self):
         if self._compressor:
             if self._compress_type == CompressType.gzip_broken:
-                data = self._compressor.close()[:-4] + b'\xde\xad\xbe\xef'
-                yield from super().write_content(data)
+                data = self.break_gzip(self._compressor.close())
+                yield from self.write_encoded(data)
             else:
-                yield from super().write_content(self._compressor.close())
+                yield from self.write_encoded(self._compressor.close())
 
         yield from super().finish()
 
     @asyncio.coroutine
     def write(self, data):
+        yield from self._fuzz_send(self._take_pending_head([data]))
+
+    @asyncio.coroutine
+    def writelines(self, parts):
+        if self.server.fragmented_writes:
+            yield from super().writelines(parts)
+        else:
+            yield from self._fuzz_send(self._take_pending_head(parts))
+
+    @asyncio.coroutine
+    def _fuzz_send(self, parts):
+        '''Send the parts, including a deferred head, as one fuzzed write.'''
+        if (yield from self._fuzz_write()):
+            if len(parts) == 1:
+                parts = [self._fuzz.mangle(parts[0])]
+            elif self._fuzz.mangles:
+                parts = [self._fuzz.mangle(b''.join(parts))]
+
+            yield from self._send(parts)
+
+    @asyncio.coroutine
+    def _fuzz_read(self):
+        '''Draw the faults of reading the request.
+
+        There is a draw for each line of the head and one for the payload.
+        They are drawn when the request is handled, so that they do not
+        depend on how the request was split into reads or pipelined.
+        '''
+        count = self.request.line_count
+
+        if self.request.payload is not None:
+            count += 1
+
+        for dummy in range(count):
+            if not (yield from self._fuzz_write()):
+                return False
+
+        return True
+
+    @asyncio.coroutine
+    def _fuzz_write(self):
         hang_time = self._fuzz.hang_time()
         connection_action = self._fuzz.connection_action()
 
@@ -193,21 +217,26 @@ class FuzzHandler(Handler):
 
         if connection_action == ConnectionAction.close:
             self.close()
-            return
+            return False
         elif connection_action == ConnectionAction.reset:
             self.reset_connection()
-            return
+            return False
 
-        data = self._fuzz.mangle(data)
-
-        yield from super().write(data)
+        return True
 
 
 class SiteHandler(FuzzHandler):
+    RENDER_CACHEABLE = False
+    RENDER_CACHE_MAX_THRESHOLD = 0.01
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.encoding = 'utf_8'
         self.charset = ''
+        self.doctype = ''
+        self._render_key = None
+        self._render_version = None
+        self._rendered = None
 
     def fuzz_encoding(self):
         codec_name, encoding_name = self._fuzz.codec()
@@ -233,17 +262,74 @@ class SiteHandler(FuzzHandler):
                     'HUHHTTP{}=SUPER SERVER!'
                     .format(self._fuzz.counter).encode('ascii')
             })
-        yield from self.write_content(self.format_template())
+        self.doctype = self._fuzz.doctype()
+
+        if not (yield from self.replay_rendered(self.doctype)):
+            yield from self.write_content(self.format_template())
 
     def format_template(self):
-        return SITE_TEMPLATE.format(
-            doctype=self._fuzz.doctype(),
+        return SITE_PAGE.render(
+            self.encoding,
+            doctype=self.doctype,
             charset=self.charset,
-            banner=BANNER_NAV,
             title=self.get_title(),
             body=self.get_body(),
             recent_posts=self.recent_posts(),
-        ).encode(self.encoding, 'replace')
+        )
+
+    def render_cache_key(self, *extra):
+        '''Return the key of the rendered body or None if it may vary.
+
+        Only sessions with a threshold near zero that do not mangle are
+        cached.
+        '''
+        if self.RENDER_CACHEABLE and not self._fuzz.mangles and \
+                self._fuzz.threshold < self.RENDER_CACHE_MAX_THRESHOLD:
+            return (type(self), self.match.string, self.encoding,
+                    self.charset, self._compress_type) + extra
+
+    @asyncio.coroutine
+    def replay_rendered(self, *extra):
+        '''Write the cached body and return True if there is one.
+
+        Otherwise the body written from now on is recorded and cached when
+        the response finishes.
+        '''
+        key = self.render_cache_key(*extra)
+
+        if key is None:
+            return False
+
+        pieces = RENDER_CACHE.get(key)
+
+        if pieces is None:
+            self._render_key = key
+            self._render_version = RENDER_CACHE.version(type(self))
+            self._rendered = []
+            return False
+
+        self._compressor = None
+
+        for data in pieces:
+            yield from self.write_encoded(data)
+
+        return True
+
+    @asyncio.coroutine
+    def write_encoded(self, data):
+        if self._rendered is not None:
+            self._rendered.append(data)
+
+        yield from super().write_encoded(data)
+
+    @asyncio.coroutine
+    def finish(self):
+        yield from super().finish()
+
+        if self._rendered is not None:
+            RENDER_CACHE.store(
+                self._render_key, self._rendered, self._render_version)
+            self._rendered = None
 
     def get_title(self):
         return ('A WEB SITE FOR SMAUG THE DRAGON FOR WHO WITHIN '
@@ -254,42 +340,20 @@ class SiteHandler(FuzzHandler):
         return ''
 
     def recent_posts(self):
-        text = []
-
-        for date in POST_KEYS[:3]:
-            post = POSTS[date]
-            text.append(
-                '<LI><A HREF="wirdpress/post/{}/{}/{}/{}">{}</A>'
-                .format(date[0], date[1], date[2],
-                        post_content_to_url_slug(post),
-                        post[:60])
-            )
-
-        return ''.join(text)
-
-    def all_posts(self):
-        text = []
-
-        for date in POST_KEYS:
-            post = POSTS[date]
-            text.append(
-                '<LI><A HREF="wirdpress/post/{}/{}/{}/{}">{}</A>'
-                .format(date[0], date[1], date[2],
-                        post_content_to_url_slug(post),
-                        post[:60])
-            )
-
-        return ''.join(text)
+        return self.server.corpus.recent_posts
 
 
 class SmokeTestHandler(SiteHandler):
     @asyncio.coroutine
     def process(self):
+        self.etag_key = 'smoketest'
         yield from self.write_header(200, b'OK')
         yield from self.write_content(b'It looks ok!')
 
 
 class HomeHandler(SiteHandler):
+    RENDER_CACHEABLE = True
+
     def get_body(self):
         return INDEX_CONTENT + DEFAULT_REASON.decode('ascii')
 
@@ -303,6 +367,7 @@ class ImagesHandler(SiteHandler):
         '.ogg': 'application/ogg',
         '.xml': 'application/xml',
     }
+    PIECE_SIZE = 65536
 
     @asyncio.coroutine
     def process(self):
@@ -322,7 +387,9 @@ class ImagesHandler(SiteHandler):
         content_type = self.EXTENSION_MAP.get(
             extension, 'text/html').encode('ascii')
 
-        if os.path.isfile(path):
+        asset = self.server.asset_cache.get(path)
+
+        if asset:
             before_date_tuple = email.utils.parsedate(
                 self.request.fields.get(b'If-Modified-Since', b'')
                 .decode('ascii', 'replace'))
@@ -332,40 +399,206 @@ class ImagesHandler(SiteHandler):
             else:
                 before_time = None
 
-            if before_time is not None and \
-                    before_time >= int(os.path.getmtime(path)):
+            if before_time is not None and before_time >= int(asset.mtime):
                 yield from self.write_header(
                     304,
                     b'One does not simply HTTP into Mordor',
                     headers={
-                        b'Last-modified': email.utils.formatdate(
-                            os.path.getmtime(path)).encode('ascii'),
+                        b'Last-modified': asset.last_modified,
                     })
                 yield from self.write_content(b'What is HTTP?')
                 return
 
-            yield from self.write_header(
-                200, b'',
-                headers={
-                    b'Content-Type': content_type,
-                    b'Last-modified': email.utils.formatdate(
-                        os.path.getmtime(path)).encode('ascii'),
-                    b'Accept-Ranges': b'bytes',
-                    b'Content-Range': b'bytes 0-',
-                    b'Expires': b'Thu, Apr 01 Sep 1993 24:00:00 GMT',
-                })
+            headers = {
+                b'Content-Type': content_type,
+                b'Last-modified': asset.last_modified,
+                b'Accept-Ranges': b'bytes',
+                b'Content-Range': b'bytes 0-',
+                b'Expires': b'Thu, Apr 01 Sep 1993 24:00:00 GMT',
+            }
+
+            if asset.data is not None:
+                yield from self._write_cached(asset, headers)
+                return
 
             with open(path, 'rb') as file:
-                while True:
-                    data = file.read(4096)
+                size = os.fstat(file.fileno()).st_size
+
+                if not self._compressor:
+                    headers[b'Etag'] = asset.etag
+                    ranges = self.requested_ranges(
+                        size, asset.etag, asset.last_modified)
 
-                    if not data:
-                        break
+                    if ranges is not None:
+                        yield from self._write_mapped_ranges(
+                            file, size, ranges, headers)
+                        return
 
-                    yield from self.write_content(data)
+                yield from self.write_header(200, b'', headers=headers)
+
+                if size > self.MAX_BUFFER_SIZE and \
+                        not self._compressor and \
+                        not self._fuzz.mangles and \
+                        not self.server.fragmented_writes:
+                    yield from self.send_file(file, 0, size)
+                else:
+                    yield from self._write_mapped(file, size)
         else:
             yield from super().process()
 
+    @asyncio.coroutine
+    def _encode_asset(self, asset):
+        '''Return the level and compressed contents of an asset.
+
+        Contents cached at another level are only used while the
+        compression level is lowered for load.
+        '''
+        compressor_class = type(self._compressor)
+        level = self._compressor.level
+        encoding = self.server.asset_cache.get_encoding(
+            asset, compressor_class, level,
+            any_level=level < self.server.compression.base_level)
+
+        if encoding is None:
+            data = yield from self.server.compression.run(
+                asset.size, compress_data, compressor_class, asset.data,
+                level)
+            self.server.asset_cache.put_encoding(
+                asset, compressor_class, level, data)
+            encoding = (level, data)
+
+        return encoding
+
+    def requested_ranges(self, length, etag, last_modified):
+        '''Return the ranges to send or None to send the whole content.
+
+        An empty list means that none of the ranges can be satisfied.
+        '''
+        value = self.request.fields.get(b'Range')
+
+        if value is None or self.request.method != b'GET':
+            return None
+
+        if_range = self.request.fields.get(b'If-Range')
+
+        if if_range is not None and \
+                if_range.strip() not in (etag, last_modified):
+            return None
+
+        return parse_byte_ranges(value, length)
+
+    @asyncio.coroutine
+    def _write_cached(self, asset, headers):
+        data = asset.data
+        etag = asset.etag
+
+        if self._compressor:
+            level, data = yield from self._encode_asset(asset)
+            etag += '-{}-{}'.format(
+                self._compress_type.value, level).encode('ascii')
+            self._compressor = None
+
+            if self._compress_type == CompressType.gzip_broken:
+                data = self.break_gzip(data)
+
+        headers[b'Etag'] = etag
+        ranges = self.requested_ranges(len(data), etag, asset.last_modified)
+
+        if ranges is not None:
+            yield from self._write_ranges(memoryview(data), ranges, headers)
+            return
+
+        yield from self.write_header(200, b'', headers=headers)
+
+        if self.server.fragmented_writes:
+            view = memoryview(data)
+
+            for offset in range(0, len(data), 4096):
+                yield from self.write_content(view[offset:offset + 4096])
+        else:
+            yield from self.send_content(data)
+
+    @asyncio.coroutine
+    def _write_mapped(self, file, size):
+        if not size:
+            return
+
+        if self.server.fragmented_writes:
+            piece_size = 4096
+        else:
+            piece_size = self.PIECE_SIZE
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, size, piece_size):
+                yield from self.write_content(
+                    mapped[offset:offset + piece_size])
+
+    @asyncio.coroutine
+    def _write_mapped_ranges(self, file, size, ranges, headers):
+        if not ranges:
+            yield from self._write_unsatisfiable(size, headers)
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from self._write_ranges(mapped, ranges, headers)
+
+    @asyncio.coroutine
+    def _write_ranges(self, content, ranges, headers):
+        length = len(content)
+
+        if not ranges:
+            yield from self._write_unsatisfiable(length, headers)
+            return
+
+        fault = self._fuzz.range_fault()
+
+        if fault == RangeFault.wrong_total:
+            length -= 1
+
+        if fault == RangeFault.off_by_one:
+            ranges = [(first, last + 1) for first, last in ranges]
+
+        content_ranges = [
+            'bytes {}-{}/{}'.format(first, last, length).encode('ascii')
+            for first, last in ranges
+        ]
+
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            headers[b'Content-Range'] = content_ranges[0]
+            yield from self.write_header(
+                206, b'Partial Content', headers=headers)
+            yield from self.send_content(content[first:last + 1])
+            return
+
+        boundary = 'SmaugHoard{}'.format(self._fuzz.counter).encode('ascii')
+        content_type = headers[b'Content-Type']
+        headers[b'Content-Type'] = \
+            b'multipart/byteranges; boundary=' + boundary
+        del headers[b'Content-Range']
+        parts = []
+
+        for (first, last), content_range in zip(ranges, content_ranges):
+            parts.extend([
+                b'--', boundary, b'\r\n',
+                b'Content-Type: ', content_type, b'\r\n',
+                b'Content-Range: ', content_range, b'\r\n\r\n',
+                content[first:last + 1], b'\r\n',
+            ])
+
+        if fault != RangeFault.unterminated:
+            parts.extend([b'--', boundary, b'--\r\n'])
+
+        yield from self.write_header(206, b'Partial Content', headers=headers)
+        yield from self.send_content(b''.join(parts))
+
+    @asyncio.coroutine
+    def _write_unsatisfiable(self, length, headers):
+        headers[b'Content-Range'] = 'bytes */{}'.format(length).encode('ascii')
+        yield from self.write_header(
+            416, b'Range Not Satisfiable', headers=headers)
+        yield from self.send_content(b'')
+
     def get_body(self):
         return '<h1>404 Not Found</h2>'
 
@@ -373,6 +606,7 @@ class ImagesHandler(SiteHandler):
 class NotFoundHandler(SiteHandler):
     @asyncio.coroutine
     def process(self):
+        self.etag_key = 'not_found'
         yield from self.write_header(
             404, b'404 Not found', headers={b'Content-Type': b'text/html'})
         yield from self.write_content(SIMPLE_404.encode('utf16'))
@@ -397,6 +631,7 @@ class GuestbookIntroHandler(SiteHandler):
 
 
 class GuestbookHandler(SiteHandler):
+    RENDER_CACHEABLE = True
     MESSAGES = collections.deque(maxlen=20)
 
     def __init__(self, *args, **kwargs):
@@ -413,6 +648,7 @@ class GuestbookHandler(SiteHandler):
 
             if values:
                 self.MESSAGES.append(values[0].decode('ascii', 'replace'))
+                RENDER_CACHE.invalidate(GuestbookHandler)
 
         yield from super().process()
 
@@ -444,8 +680,27 @@ class CalendarHandler(SiteHandler):
             self.year, self.MONTHS[self.month], self.day)
 
     def get_body(self):
-        prev_year = self.year
-        prev_month = self.month - 1
+        key = (self.year, self.month, self.day)
+        corpus = self.server.corpus
+        post = corpus.get(key)
+
+        if post is not None:
+            entry = '<A HREF="{}">{}</A>'.format(corpus.url(key), post[:60])
+        else:
+            entry = 'Sorry no posts on this day.'
+
+        return self.calendar_fragment(self.year, self.month) + entry
+
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def calendar_fragment(cls, year, month):
+        '''Return the calendar of a month with its day picker.
+
+        It does not depend on the day, so it is made once per month while
+        it stays in the cache.
+        '''
+        prev_year = year
+        prev_month = month - 1
 
         if prev_month <= 0:
             prev_year -= 1
@@ -454,8 +709,8 @@ class CalendarHandler(SiteHandler):
         prev_link = '/wirdpress/calendar/{}/{}/{}/'.format(
             prev_year, prev_month, 1)
 
-        next_year = self.year
-        next_month = self.month + 1
+        next_year = year
+        next_month = month + 1
 
         if next_month >= 13:
             next_year += 1
@@ -466,42 +721,26 @@ class CalendarHandler(SiteHandler):
 
         picker = []
 
-        for row in calendar.monthcalendar(self.year, self.month):
+        for row in calendar.monthcalendar(year, month):
             for day in row:
                 if day:
                     picker.append(
                         '<A HREF=wirdpress/calendar/{}/{}/{}/>{}</A> '
-                        .format(self.year, self.month, day, day)
+                        .format(year, month, day, day)
                     )
                 else:
                     picker.append('<A></A> ')
 
             picker.append('<BR>')
 
-        picker = ''.join(picker)
-
-        content = []
-        content.append(
-            CALENDAR_TEMPLATE.format(
-                month=self.MONTHS[self.month],
-                prev_link=prev_link, next_link=next_link, picker=picker)
-        )
-
-        post = POSTS.get((self.year, self.month, self.day))
-
-        if post:
-            slug = post_content_to_url_slug(post)
-            content.append(
-                '<A HREF="wirdpress/post/{}/{}/{}/{}">{}</A>'
-                .format(self.year, self.month, self.day, slug, post[:60])
-            )
-        else:
-            content.append('Sorry no posts on this day.')
-
-        return ''.join(content)
+        return CALENDAR_TEMPLATE.format(
+            month=cls.MONTHS[month],
+            prev_link=prev_link, next_link=next_link, picker=''.join(picker))
 
 
 class PostHandler(SiteHandler):
+    RENDER_CACHEABLE = True
+
     @asyncio.coroutine
     def process(self):
         self.stream()
@@ -509,7 +748,7 @@ class PostHandler(SiteHandler):
         self.month = int(self.match.group(2)) % 13
         self.day = int(self.match.group(3)) % 32
 
-        self.post = POSTS.get((self.year, self.month, self.day))
+        self.post = self.server.corpus.get((self.year, self.month, self.day))
 
         if self.post is not None:
             yield from super().process()
@@ -525,8 +764,8 @@ class PostHandler(SiteHandler):
     def get_body(self):
         if self.post is not None:
             key = (self.year, self.month, self.day)
-            prev_post_key = self.get_prev_post_key(key)
-            next_post_key = self.get_next_post_key(key)
+            prev_post_key = self.server.corpus.prev_key(key)
+            next_post_key = self.server.corpus.next_key(key)
 
             post_date = (
                 '<A HREF=wirdpress/calendar/{}/{}/{}/>{} {} {}</A>'
@@ -538,22 +777,12 @@ class PostHandler(SiteHandler):
             content = []
 
             if prev_post_key:
-                year, month, day = prev_post_key
-                post = POSTS[prev_post_key]
-                slug = post_content_to_url_slug(post)
-                content.append(
-                    '<A HREF="wirdpress/post/{}/{}/{}/{}">PREV</A>'
-                    .format(year, month, day, slug)
-                )
+                content.append('<A HREF="{}">PREV</A>'.format(
+                    self.server.corpus.url(prev_post_key)))
 
             if next_post_key:
-                year, month, day = next_post_key
-                post = POSTS[next_post_key]
-                slug = post_content_to_url_slug(post)
-                content.append(
-                    '<A HREF="wirdpress/post/{}/{}/{}/{}">NEXT</A>'
-                    .format(year, month, day, slug)
-                )
+                content.append('<A HREF="{}">NEXT</A>'.format(
+                    self.server.corpus.url(next_post_key)))
 
             return POST_ENTRY.format(
                 date=post_date,
@@ -567,193 +796,332 @@ class PostHandler(SiteHandler):
                 'Sorry, Smaug must have incinerated this post.'
             )
 
-    @classmethod
-    def get_prev_post_key(cls, date):
-        try:
-            index = POST_KEYS.index(date)
-            return POST_KEYS[max(0, index - 1)]
-        except ValueError:
-            pass
 
-    @classmethod
-    def get_next_post_key(cls, date):
-        try:
-            index = POST_KEYS.index(date)
-            return POST_KEYS[index + 1]
-        except (ValueError, IndexError):
-            pass
+class AllPostsHandler(SiteHandler):
+    RENDER_CACHEABLE = True
 
+    @asyncio.coroutine
+    def process(self):
+        self.page = int(self.match.group(1) or 1)
+        self.posts = self.server.corpus.listing(self.page)
+
+        if self.posts is not None:
+            yield from super().process()
+        else:
+            yield from self.write_cms(404, b'Not found')
 
-class AllPostsHandler(SiteHandler):
     def get_title(self):
         return 'All Smaug ghosts.'
 
     def get_body(self):
-        return self.all_posts()
+        if self.posts is None:
+            return '<H1>Page not found</H1><P>Smaug ate this page.'
+
+        content = [self.posts]
+
+        if self.page > 1:
+            content.append(
+                '<A HREF="wirdpress/post/all/posts/{}">PREV</A>'
+                .format(self.page - 1))
+
+        if self.page < self.server.corpus.page_count:
+            content.append(
+                '<A HREF="wirdpress/post/all/posts/{}">NEXT</A>'
+                .format(self.page + 1))
+
+        return '\n'.join(content)
 
 
 class DQueryMaxHandler(SiteHandler):
+    VARIABLE_COUNT = 100000
+    VARIABLE_TEMPLATE = (b'/* DragonQuery maximum JS file*/\r\n'
+                         b'var v%d; /* pre-allocate some bytes */\n')
+
     @asyncio.coroutine
     def process(self):
         self.stream()
         yield from self.write_header(
             200, b'OK', headers={b'Content-type': b'application/javascript'})
 
-        for i in range(100000):
-            yield from self.write_content(
-                b'/* DragonQuery maximum JS file*/\r\n')
-            yield from self.write_content(b'var v')
-            yield from self.write_content(str(i).encode('ascii'))
-            yield from self.write_content(b'; /* pre-allocate some bytes */\n')
+        block_size = self.server.dquery_block_size
+
+        for start in range(0, self.VARIABLE_COUNT, block_size):
+            stop = min(start + block_size, self.VARIABLE_COUNT)
+            yield from self.write_content(b''.join(
+                self.VARIABLE_TEMPLATE % i for i in range(start, stop)))
 
         yield from self.write_content(b'\xFF\xFE\x80')
 
 
 class SmileyHandler(SiteHandler):
-    @asyncio.coroutine
-    def _messy_chunked(self):
-        yield from self.write(b'HTTP/1.1 200\r\n')
-        yield from self.write(b'Transfer-ENCODING: chunked\r\n\r\n')
-        yield from self.write(b'5 ; horse\nhello\n0007\n world!\n0\n')
-        yield from self.write(b'Animal: dolphin\r\nCake: delicious\r\n\r\n')
+    '''Broken responses written straight to the connection.
+
+    Each variant returns the list of writes that make it up. The writes
+    are joined once into a payload kept with their ends. A payload is sent
+    in writes of up to ``WRITE_SIZE`` bytes, or in its original writes when
+    the server has ``fragmented_writes``. The ``surprise`` bomb is too big
+    to keep and is written straight from its file.
+    '''
+    WRITE_SIZE = 262144
+    MAX_BOMB_SIZE = 2 ** 50
+    BOMB_PARAMETERS = ('size', 'ratio', 'depth', 'encoding')
+    PAYLOADS = {}
+    CLOSING_VARIANTS = frozenset(['oops', 'welcome4'])
+
+    @staticmethod
+    def _messy_chunked():
+        return [
+            b'HTTP/1.1 200\r\n',
+            b'Transfer-ENCODING: chunked\r\n\r\n',
+            b'5 ; horse\nhello\n0007\n world!\n0\n',
+            b'Animal: dolphin\r\nCake: delicious\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _overrun_response():
+        return [
+            b'HTTP/1.1\t200\r\n',
+            b'Content-Length:\t100\r\n\r\n',
+            b'A' * 200,
+        ]
+
+    @staticmethod
+    def _buffer_overflow():
+        parts = [
+            b'HTTP/1.1 200\r\n',
+            b'Transfer-Encoding: chunked\r\n\r\n',
+        ]
 
-    @asyncio.coroutine
-    def _overrun_response(self):
-        yield from self.write(b'HTTP/1.1\t200\r\n')
-        yield from self.write(b'Content-Length:\t100\r\n\r\n')
-        yield from self.write(b'A' * 200)
-
-    @asyncio.coroutine
-    def _buffer_overflow(self):
-        yield from self.write(b'HTTP/1.1 200\r\n')
-        yield from self.write(b'Transfer-Encoding: chunked\r\n\r\n')
+        for dummy in range(100):
+            parts.append(b'0' * 10000)
+
+        parts.append(b'1\r\n')
+        parts.append(b'a\r\n')
+        parts.append(b'0\r\n\r\n')
+
+        return parts
+
+    @staticmethod
+    def _content_length_and_chunked():
+        return [
+            b'HTTP/1.1 200\r\n',
+            b'Transfer-Encoding: chunked\r\n',
+            b'Content-Length: 42\r\n\r\n',
+            b'5\r\nhello\r\n7\r\n world!\r\n0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _utf8_header_and_short_close():
+        return [
+            b'HTTP/1.0 200\r\n',
+            b'Emoji: ' + '🐲\r\n'.encode('utf8'),
+            b'Content-Length: 100\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _messy_header():
+        return [
+            b'HTTP/1.1 200\r\n',
+            'K: Кракозябры\r\n'.encode('koi8-r'),
+            'M: 文字化け\r\n'.encode('shift_jis'),
+            b'Oops!\r\n',
+            b'Set-Cookie: \x00?#?+:%ff=hope you have '
+            b'cookies enabled!; expires=Dog\r\n' * 1000,
+            b'Set-Cookie: wow!!; Expires=Sit, 28 Dec 2024 01:59:61 GMT\r\n',
+            b'Set-Cookie: smaug=smog; '
+            b'Expires=Sat, 28 Dec-2024 01:59:61 GMT\r\n',
+            b'Set-Cookie: ; Expires=Thu, 01 Jan 1970 00:00:10 GMT\r\n',
+            b'Content-Length: -12\r\n',
+            b'Set-Cookie: SMAUGYO\r\n',
+        ]
+
+    @staticmethod
+    def _bad_content_length():
+        return [
+            b'HTTP/1.0 200\r\n',
+            b'Content-Length: 3.14159\r\n',
+        ]
+
+    @staticmethod
+    def _no_content():
+        return [b'HTTP/1.0 204\r\n\r\n']
+
+    @staticmethod
+    def _non_http_redirect():
+        return [
+            b'HTTP/1.0 302\r\n',
+            b'Location: mailto:user@example.com\r\n',
+            b'Content-Length: 0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _bad_http_redirect():
+        return [
+            b'HTTP/1.0 302\r\n',
+            b'Location: I\'m going to Dragon City!\r\n',
+            b'Content-Length: 0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _redirect_1():
+        return [
+            b'HTTP/1.0 302\r\n',
+            b'Location: bounce2.gif\r\n',
+            b'Content-Length: 0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _redirect_2():
+        return [
+            b'HTTP/1.0 301\r\n',
+            b'Location: bounce1.gif\r\n',
+            b'Content-Length: 0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _redirect_bad_url():
+        return [
+            b'HTTP/1.0 301\r\n',
+            b'Location: http://]/\x00http://\r\n',
+            b'Content-Length: 0\r\n\r\n',
+        ]
+
+    @staticmethod
+    def _big_header():
+        parts = [b'HTTP/1.0 200\r\n']
 
         for dummy in range(100):
-            yield from self.write(b'0' * 10000)
-        yield from self.write(b'1\r\n')
-        yield from self.write(b'a\r\n')
-        yield from self.write(b'0\r\n\r\n')
+            parts.append(b'A' * 10000)
 
-    @asyncio.coroutine
-    def _content_length_and_chunked(self):
-        yield from self.write(b'HTTP/1.1 200\r\n')
-        yield from self.write(b'Transfer-Encoding: chunked\r\n')
-        yield from self.write(b'Content-Length: 42\r\n\r\n')
-        yield from self.write(b'5\r\nhello\r\n7\r\n world!\r\n0\r\n\r\n')
+        parts.append(b': A\r\n')
+        parts.append(b'Content-Length: 0\r\n\r\n')
 
-    @asyncio.coroutine
-    def _utf8_header_and_short_close(self):
-        yield from self.write(b'HTTP/1.0 200\r\n')
-        yield from self.write(b'Emoji: ' + '🐲\r\n'.encode('utf8'))
-        yield from self.write(b'Content-Length: 100\r\n\r\n')
-        self.close()
+        return parts
 
     @asyncio.coroutine
-    def _messy_header(self):
-        yield from self.write(b'HTTP/1.1 200\r\n')
-        yield from self.write('K: Кракозябры\r\n'.encode('koi8-r'))
-        yield from self.write('M: 文字化け\r\n'.encode('shift_jis'))
-        yield from self.write(b'Oops!\r\n')
-        yield from self.write(b'Set-Cookie: \x00?#?+:%ff=hope you have '
-                              b'cookies enabled!; expires=Dog\r\n' * 1000)
-        yield from self.write(
-            b'Set-Cookie: wow!!; Expires=Sit, 28 Dec 2024 01:59:61 GMT\r\n'
-        )
-        yield from self.write(
-            b'Set-Cookie: smaug=smog; Expires=Sat, 28 Dec-2024 01:59:61 GMT\r\n'
-        )
-        yield from self.write(
-            b'Set-Cookie: ; Expires=Thu, 01 Jan 1970 00:00:10 GMT\r\n'
-        )
-        yield from self.write(b'Content-Length: -12\r\n')
-        yield from self.write(b'Set-Cookie: SMAUGYO\r\n')
+    def _zlib_bomb(self):
+        '''Write the bomb file in chunks of 64 bytes.
 
-    @asyncio.coroutine
-    def _bad_content_length(self):
-        yield from self.write(b'HTTP/1.0 200\r\n')
-        yield from self.write(b'Content-Length: 3.14159\r\n')
+        The file is decompressed as it is sent instead of being kept as a
+        payload, so only about ``WRITE_SIZE`` bytes of it are held at once.
+        '''
+        parts = [
+            b'HTTP/1.1 200 Ha ha ha BWAAH HA HA HA!\r\n',
+            b'Content-Encoding: gzip\r\n',
+            b'Transfer-Encoding: chunked\r\n\r\n',
+        ]
 
-    @asyncio.coroutine
-    def _no_content(self):
-        yield from self.write(b'HTTP/1.0 204\r\n\r\n')
+        path = os.path.join(ImagesHandler.ASSET_DIR, 'SMAUG.SMAUG.gz')
+        with gzip.open(path, 'rb') as in_file:
+            while True:
+                block = in_file.read(self.WRITE_SIZE // 2)
 
-    @asyncio.coroutine
-    def _non_http_redirect(self):
-        yield from self.write(b'HTTP/1.0 302\r\n')
-        yield from self.write(b'Location: mailto:user@example.com\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+                if not block:
+                    break
 
-    @asyncio.coroutine
-    def _bad_http_redirect(self):
-        yield from self.write(b'HTTP/1.0 302\r\n')
-        yield from self.write(b'Location: I\'m going to Dragon City!\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+                view = memoryview(block)
 
-    @asyncio.coroutine
-    def _redirect_1(self):
-        yield from self.write(b'HTTP/1.0 302\r\n')
-        yield from self.write(b'Location: bounce2.gif\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+                for start in range(0, len(block), 64):
+                    data = view[start:start + 64]
+                    parts.append('{:x}\r\n'.format(len(data)).encode('ascii'))
+                    parts.append(data)
+                    parts.append(b'\r\n')
 
-    @asyncio.coroutine
-    def _redirect_2(self):
-        yield from self.write(b'HTTP/1.0 301\r\n')
-        yield from self.write(b'Location: bounce1.gif\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+                yield from self.writelines(parts)
+                parts = []
 
-    @asyncio.coroutine
-    def _redirect_bad_url(self):
-        yield from self.write(b'HTTP/1.0 301\r\n')
-        yield from self.write(b'Location: http://]/\x00http://\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+        parts.append(b'0\r\n\r\n')
+        yield from self.writelines(parts)
 
     @asyncio.coroutine
-    def _big_header(self):
-        yield from self.write(b'HTTP/1.0 200\r\n')
-        for dummy in range(100):
-            yield from self.write(b'A' * 10000)
-        yield from self.write(b': A\r\n')
-        yield from self.write(b'Content-Length: 0\r\n\r\n')
+    def _custom_bomb(self, query):
+        '''Write a bomb made to the query parameters.
 
-    @asyncio.coroutine
-    def _zlib_bomb(self):
-        yield from self.write(b'HTTP/1.1 200 Ha ha ha BWAAH HA HA HA!\r\n')
-        yield from self.write(b'Content-Encoding: gzip\r\n')
-        yield from self.write(b'Transfer-Encoding: chunked\r\n\r\n')
+        The parameters are ``size`` of the content, deflate ``ratio``,
+        ``depth`` of compression and ``encoding``. Only the outermost
+        layer is declared, except for ``chained`` where every layer is.
+        '''
+        try:
+            size = int(query.get('size', [2 ** 30])[0])
+            ratio = min(float(query.get('ratio', [MAX_RATIO])[0]), MAX_RATIO)
+            depth = int(query.get('depth', [1])[0])
+            encoding = query.get('encoding', ['gzip'])[0]
+        except ValueError:
+            size = None
 
-        path = os.path.join(ImagesHandler.ASSET_DIR, 'SMAUG.SMAUG.gz')
-        with gzip.open(path, 'rb') as in_file:
-            while True:
-                data = in_file.read(64)
+        if size is None or not 0 <= size <= self.MAX_BOMB_SIZE or \
+                not ratio >= 1 or not 1 <= depth <= MAX_DEPTH or \
+                encoding not in ENCODINGS:
+            yield from self.write_cms(400, b'Not a surprise')
+            return
 
-                if not data:
-                    break
+        layer, codings = make_bomb(size, ratio, depth, encoding)
 
-                yield from self.write(
-                    '{:x}\r\n'.format(len(data)).encode('ascii'))
-                yield from self.write(data)
-                yield from self.write(b'\r\n')
+        if encoding != 'chained':
+            codings = codings[-1:]
 
-        yield from self.write(b'0\r\n\r\n')
+        yield from self.write(
+            b'HTTP/1.1 200 Ha ha ha BWAAH HA HA HA!\r\n' +
+            'Content-Encoding: {}\r\nContent-Length: {}\r\n\r\n'.format(
+                ', '.join(codings), layer.size).encode('ascii') +
+            layer.head)
 
-    @asyncio.coroutine
-    def _empty_header(self):
-        yield from self.write(b'\r\n\r\n')
+        units_per_write = max(1, self.WRITE_SIZE // len(layer.unit))
+        writes, extra = divmod(layer.count, units_per_write)
+        data = layer.unit * units_per_write
 
-    @asyncio.coroutine
-    def _many_header(self):
-        yield from self.write(b'HTTP/1.0 200 Headers\r\n')
+        for dummy in range(writes):
+            yield from self.write(data)
+
+        yield from self.write(layer.unit * extra + layer.tail)
+
+    @staticmethod
+    def _empty_header():
+        return [b'\r\n\r\n']
+
+    @staticmethod
+    def _many_header():
+        parts = [b'HTTP/1.0 200 Headers\r\n']
 
         for num in range(10000):
-            yield from self.write(
+            parts.append(
                 ('H{0}: A header for me\r\n'
                  'H{0} : A header for you\r\n'
                  'H{0}  : I have a header\r\n'
                  'H{0}   : You have one too\r\n'
                  ).format(num).encode('ascii'))
 
-        yield from self.write(b'\r\n')
-        self.close()
+        parts.append(b'\r\n')
+
+        return parts
+
+    @classmethod
+    def payload(cls, name, func):
+        '''Return the bytes of a variant and the ends of its writes.'''
+        payload = cls.PAYLOADS.get(name)
+
+        if payload is None:
+            parts = func()
+            ends = array.array('Q', itertools.accumulate(
+                len(data) for data in parts))
+            payload = cls.PAYLOADS[name] = (b''.join(parts), ends)
+
+        return payload
+
+    @asyncio.coroutine
+    def write_payload(self, payload):
+        data, ends = payload
+        view = memoryview(data)
+
+        if self.server.fragmented_writes:
+            start = 0
+
+            for end in ends:
+                yield from self.write(view[start:end])
+                start = end
+        else:
+            for start in range(0, len(data), self.WRITE_SIZE):
+                yield from self.write(view[start:start + self.WRITE_SIZE])
 
     @asyncio.coroutine
     def process(self):
@@ -772,24 +1140,42 @@ class SmileyHandler(SiteHandler):
             'bounce2': self._redirect_2,
             'cool4': self._redirect_bad_url,
             'jokes2': self._big_header,
-            'surprise': self._zlib_bomb,
             'confused3': self._empty_header,
             'welcome4': self._many_header,
         }
 
-        func = func_map.get(self.match.group(1).decode('ascii', 'replace'))
-
-        if func:
-            yield from func()
+        name = self.match.group(1).decode('ascii', 'replace')
+        func = func_map.get(name)
+        query = urllib.parse.parse_qs(
+            urllib.parse.urlsplit(self.request.uri).query.decode(
+                'ascii', 'replace'))
+
+        if name == 'surprise' and \
+                any(key in query for key in self.BOMB_PARAMETERS):
+            yield from self._custom_bomb(query)
+        elif name == 'surprise':
+            yield from self._zlib_bomb()
+        elif func:
+            yield from self.write_payload(self.payload(name, func))
+
+            if name in self.CLOSING_VARIANTS:
+                self.close()
         else:
             yield from super().process()
 
 
 class RssHandler(SiteHandler):
+    RENDER_CACHEABLE = True
+
     @asyncio.coroutine
     def process(self):
+        self.etag_key = ('feed', self.match.group(1), self.encoding)
         yield from self.write_header(
             200, headers={b'Content-Type': b'application/xml'})
+
+        if (yield from self.replay_rendered()):
+            return
+
         if self.match.group(1) == b'rss':
             yield from self.write_content(
                 RSS_TEMPLATE.encode(self.encoding, 'replace'))
@@ -798,19 +1184,30 @@ class RssHandler(SiteHandler):
                 ATOM_TEMPLATE.encode(self.encoding, 'replace'))
 
 
+class MazeHandler(SiteHandler):
+    @asyncio.coroutine
+    def process(self):
+        self.page = MazePage(
+            self.server.site_seed,
+            self.match.group(1).decode('utf8', 'replace'))
+        yield from super().process()
+
+    def get_title(self):
+        return self.page.title
+
+    def get_body(self):
+        return self.page.body
+
+
 class RobotsHandler(SiteHandler):
     @asyncio.coroutine
     def process(self):
+        self.etag_key = 'robots'
         yield from self.write_header(200, b'Robotic Dragons Permitted')
         yield from self.write_content(b'# Please donate Bitcoins\n')
         yield from self.write_content(b'Sitemap: /images/sitemaps.xml\n')
 
 
-def post_content_to_url_slug(text, encoding='utf-8'):
-    text = re.sub(r'([\s<>"\']+)', '-', text[:60].strip().lower()).strip('-')
-    return urllib.parse.quote(text, encoding=encoding)
-
-
 HANDLERS = [
     (br'/smoketest', SmokeTestHandler),
     (br'/(index\.htm)?', HomeHandler),
@@ -820,11 +1217,12 @@ HANDLERS = [
     (br'/images/dquery-max\.js', DQueryMaxHandler),
     (br'/images/(.*)', ImagesHandler),
     (br'/wirdpress/post/(\d{4})/(\d{1,2})/(\d{1,2})/(.*)', PostHandler),
-    (br'/wirdpress/post/all/posts', AllPostsHandler),
+    (br'/wirdpress/post/all/posts(?:/(\d+))?', AllPostsHandler),
     (br'/wirdpress/page/web_ring', WebRingPageHandler),
     (br'/wirdpress/calendar/(\d{4})/(\d{1,2})/(\d{1,2})/', CalendarHandler),
     (br'/smiley/(\w+)\.gif', SmileyHandler),
     (br'/(rss|atom)\.xml', RssHandler),
     (br'/robots\.txt', RobotsHandler),
+    (br'/maze/(.*)', MazeHandler),
     (br'/.*', NotFoundHandler),
 ]
@@ -161,6 +161,8 @@ WEB_RING_CONTENT = '''
 <A HREF="http://ｄｒａｇｏｎｗｅｉｇｈｔｌｏｓｓ．ｓｏｌｕｔｉｏｎｓ/">Is your dragon getting FAT??</A>
 <BR>
 <A HREF="http://ｆａｔ３２ｄｅｆｒａｇｍｅｎｔｅｒ.internets：：８０/">Does your dragon use FAT??</A>
+<BR>
+<A HREF=maze/>The Endless Lair of Smaug. Once you go in, you never come out!!</A>
 <P><BR>
 <BR><HR>
 <BR>
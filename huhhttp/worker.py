@@ -0,0 +1,83 @@
+import logging
+import os
+import signal
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+
+class WorkerPool(object):
+    '''Pre-forked worker processes supervised by the parent.
+
+    ``target`` is called with the worker index in each child. A worker that
+    exits while the pool is running is started again with the same index.
+    '''
+    def __init__(self, num_workers, target, restart_delay=1):
+        self.num_workers = num_workers
+        self.restart_delay = restart_delay
+        self._target = target
+        self._workers = {}
+        self._running = False
+
+    def run(self):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop_signal_handler)
+        signal.signal(signal.SIGINT, self._stop_signal_handler)
+
+        for index in range(self.num_workers):
+            self._spawn(index)
+
+        while self._workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            index = self._workers.pop(pid, None)
+
+            if index is None or not self._running:
+                continue
+
+            _logger.warning('Worker %d (pid %d) exited with status %d. '
+                            'Restarting.', index, pid, status)
+            time.sleep(self.restart_delay)
+            self._spawn(index)
+
+    def stop(self):
+        self._running = False
+
+        for pid in tuple(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _stop_signal_handler(self, signal_num, frame):
+        _logger.info('Stopping workers')
+        self.stop()
+
+    def _spawn(self, index):
+        pid = os.fork()
+
+        if pid:
+            _logger.info('Worker %d started with pid %d', index, pid)
+            self._workers[pid] = index
+            return
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        exit_code = 1
+
+        try:
+            self._target(index)
+            exit_code = 0
+        except KeyboardInterrupt:
+            exit_code = 0
+        except Exception:
+            _logger.exception('Worker %d crashed', index)
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)